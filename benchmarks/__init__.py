@@ -0,0 +1 @@
+# Benchmarks of the spiders against a local stand-in Play Store
@@ -0,0 +1,306 @@
+"""
+Benchmark the spiders against the local stand-in Play Store.
+
+Starts the synthetic store from benchmarks/server.py, crawls it with each
+requested spider in its own process (a Twisted reactor cannot be restarted),
+and writes one JSON document with, per spider:
+
+- ``pages_per_second``: responses downloaded per second of crawl time
+- ``page_latency_ms``: download latency of every response, including the
+  Selenium render for rendered pages
+- ``app_latency_ms``: time from the first download of an app page to its item,
+  including any static-to-rendered fallback
+- ``db_writes_per_second``: items stored per second of writer time
+- the full Scrapy stats of the run
+
+Every spider of a run shares one scratch directory, so ``reviews_scraper`` finds
+the apps stored by an earlier ``scrapers`` run. Example:
+
+    python -m benchmarks.run --categories 4 --apps-per-tab 25 \\
+        --output benchmark-results.json -s SELENIUM_POOL_SIZE=8
+"""
+
+import argparse
+import csv
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from urllib.parse import urlparse
+
+from benchmarks.server import SyntheticStore, start_server
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SPIDERS = ["scrapers", "acategory", "reviews_scraper", "ranking"]
+# Spiders that can be benchmarked on request only. "playstore" calls a missing
+# save_to_csv on every app page, so its numbers measure an error path.
+OPTIONAL_SPIDERS = ["playstore"]
+
+
+def summarize(values):
+    """Return count, mean, p50, p95 and max of a list of milliseconds."""
+    if not values:
+        return {"count": 0}
+    values = sorted(values)
+
+    def percentile(q):
+        return values[min(len(values) - 1, int(q * len(values)))]
+
+    return {
+        "count": len(values),
+        "mean": round(sum(values) / len(values), 1),
+        "p50": percentile(0.5),
+        "p95": percentile(0.95),
+        "max": values[-1],
+    }
+
+
+class BenchmarkStats:
+    """Extension that records page and per-app latencies during a benchmark."""
+
+    def __init__(self):
+        self.page_latencies = []
+        self.app_latencies = []
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        from scrapy import signals
+
+        extension = cls()
+        crawler.signals.connect(
+            extension.request_reached_downloader,
+            signal=signals.request_reached_downloader,
+        )
+        crawler.signals.connect(
+            extension.response_received, signal=signals.response_received
+        )
+        crawler.signals.connect(extension.item_scraped, signal=signals.item_scraped)
+        crawler.benchmark_stats = extension
+        return extension
+
+    def request_reached_downloader(self, request, spider):
+        now = time.monotonic()
+        request.meta["bench_download_start"] = now
+        # Kept across the static-to-rendered re-request, which copies the meta
+        request.meta.setdefault("bench_first_download", now)
+
+    def response_received(self, response, request, spider):
+        start = request.meta.get("bench_download_start")
+        if start is not None:
+            self.page_latencies.append(int((time.monotonic() - start) * 1000))
+
+    def item_scraped(self, item, response, spider):
+        start = response.meta.get("bench_first_download")
+        if start is not None:
+            self.app_latencies.append(int((time.monotonic() - start) * 1000))
+
+
+def benchmark_spider(spider_cls, category_urls, csv_path):
+    """Return a subclass of ``spider_cls`` that crawls the stand-in store."""
+    attrs = {"allowed_domains": [urlparse(category_urls[0]).hostname]}
+
+    # Spiders with hard-coded start pages
+    if "start_urls" in vars(spider_cls):
+        attrs["start_urls"] = category_urls
+
+    # Spiders that read ../output/categories.csv
+    for method in ("read_categories_from_csv", "load_categories_from_csv"):
+        original = getattr(spider_cls, method, None)
+        if original is not None:
+            attrs[method] = lambda self, file_path, original=original: original(
+                self, csv_path
+            )
+
+    return type(f"Benchmark{spider_cls.__name__}", (spider_cls,), attrs)
+
+
+def run_worker(args):
+    """Crawl the store with one spider and write its results to ``args.result``."""
+    from scrapy.crawler import CrawlerProcess
+    from scrapy.utils.project import get_project_settings
+
+    with open(args.csv, newline="", encoding="utf-8") as f:
+        category_urls = [row["URL"] for row in csv.DictReader(f)]
+
+    settings = get_project_settings()
+    # Keep the project's extensions, such as StageTimings
+    extensions = settings.getdict("EXTENSIONS")
+    extensions["benchmarks.run.BenchmarkStats"] = 0
+    settings.set("EXTENSIONS", extensions, "cmdline")
+    for override in args.set:
+        key, _, value = override.partition("=")
+        settings.set(key, value, "cmdline")
+
+    process = CrawlerProcess(settings)
+    spider_cls = benchmark_spider(
+        process.spider_loader.load(args.worker), category_urls, args.csv
+    )
+    crawler = process.create_crawler(spider_cls)
+    process.crawl(crawler)
+
+    start = time.monotonic()
+    process.start()
+    elapsed = time.monotonic() - start
+
+    stats = crawler.stats.get_stats()
+    extension = crawler.benchmark_stats
+    pages = stats.get("downloader/response_count", 0)
+    db_items = stats.get("db_writer/items", 0)
+    db_seconds = stats.get("db_writer/write_time_ms", 0) / 1000
+
+    result = {
+        "spider": args.worker,
+        "elapsed_seconds": round(elapsed, 3),
+        "pages": pages,
+        "pages_per_second": round(pages / elapsed, 2) if elapsed else None,
+        "items": stats.get("item_scraped_count", 0),
+        "page_latency_ms": summarize(extension.page_latencies),
+        "app_latency_ms": summarize(extension.app_latencies),
+        "db_items": db_items,
+        "db_writes_per_second": round(db_items / db_seconds, 1) if db_seconds else None,
+        "errors": stats.get("log_count/ERROR", 0),
+        "stats": stats,
+    }
+    with open(args.result, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=2, default=str)
+
+
+def run_benchmarks(args):
+    store = SyntheticStore(
+        categories=args.categories,
+        apps_per_tab=args.apps_per_tab,
+        reviews_per_app=args.reviews_per_app,
+        render_delay=args.render_delay,
+        embedded_data=not args.no_embedded_data,
+    )
+    server = start_server(store)
+    base_url = f"http://127.0.0.1:{server.server_port}"
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="playstore-bench-")
+    os.makedirs(workdir, exist_ok=True)
+    csv_path = os.path.join(workdir, "categories.csv")
+    with open(csv_path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["Category", "URL"])
+        for category in store.categories:
+            writer.writerow([category, store.category_url(base_url, category)])
+
+    env = dict(
+        os.environ,
+        SCRAPY_SETTINGS_MODULE="playstore_scraper.settings",
+        PYTHONPATH=os.pathsep.join(
+            filter(None, [REPO_ROOT, os.environ.get("PYTHONPATH")])
+        ),
+    )
+
+    results = []
+    for spider in args.spiders:
+        print(f"Benchmarking {spider}...")
+        result_path = os.path.join(workdir, f"{spider}.json")
+        command = [
+            sys.executable,
+            "-m",
+            "benchmarks.run",
+            "--worker",
+            spider,
+            "--csv",
+            csv_path,
+            "--result",
+            result_path,
+            "-s",
+            f"DB_NAME={os.path.join(workdir, 'playstore_data.db')}",
+            "-s",
+            f"LOG_FILE={os.path.join(workdir, spider + '.log')}",
+            "-s",
+            f"LOG_LEVEL={args.log_level}",
+            # Every run measures a full crawl, never a resumed one
+            "-s",
+            "FRONTIER_ENABLED=False",
+        ]
+        for override in args.set:
+            command += ["-s", override]
+
+        completed = subprocess.run(command, cwd=workdir, env=env)
+        if completed.returncode != 0 or not os.path.exists(result_path):
+            print(f"Error: {spider} exited with status {completed.returncode}")
+            results.append({"spider": spider, "exit_status": completed.returncode})
+            continue
+
+        with open(result_path, encoding="utf-8") as f:
+            result = json.load(f)
+        results.append(result)
+        print(
+            f"  {result['pages']} pages in {result['elapsed_seconds']}s "
+            f"({result['pages_per_second']} pages/s), {result['items']} items"
+        )
+
+    server.shutdown()
+
+    report = {
+        "scale": {
+            "categories": args.categories,
+            "apps_per_tab": args.apps_per_tab,
+            "reviews_per_app": args.reviews_per_app,
+            "render_delay_ms": args.render_delay,
+            "embedded_data": not args.no_embedded_data,
+        },
+        "settings": args.set,
+        "workdir": workdir,
+        "requests_served": server.requests_served,
+        "results": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, default=str)
+    print(f"Results written to {args.output}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the spiders against a local stand-in Play Store."
+    )
+    parser.add_argument(
+        "--spiders", nargs="+", default=SPIDERS, choices=SPIDERS + OPTIONAL_SPIDERS
+    )
+    parser.add_argument("--categories", type=int, default=2)
+    parser.add_argument("--apps-per-tab", type=int, default=10)
+    parser.add_argument("--reviews-per-app", type=int, default=40)
+    parser.add_argument(
+        "--render-delay",
+        type=int,
+        default=50,
+        help="milliseconds before dialogs and ranking tabs render",
+    )
+    parser.add_argument(
+        "--no-embedded-data",
+        action="store_true",
+        help="leave the ds:5 data out of app pages, so they must be rendered",
+    )
+    parser.add_argument("--output", default="benchmark-results.json")
+    parser.add_argument("--workdir", help="scratch directory (default: a new temp dir)")
+    parser.add_argument("--log-level", default="INFO")
+    parser.add_argument(
+        "-s",
+        "--set",
+        action="append",
+        default=[],
+        metavar="NAME=VALUE",
+        help="Scrapy setting for every spider run, may be repeated",
+    )
+
+    # Internal: run a single spider in this process
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    parser.add_argument("--csv", help=argparse.SUPPRESS)
+    parser.add_argument("--result", help=argparse.SUPPRESS)
+
+    args = parser.parse_args()
+    if args.worker:
+        run_worker(args)
+    else:
+        run_benchmarks(args)
+
+
+if __name__ == "__main__":
+    main()
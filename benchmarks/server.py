@@ -0,0 +1,371 @@
+"""
+Local stand-in for the Play Store used by the benchmarks.
+
+Serves synthetic category, ranking-tab, app-detail and review pages that use
+the same markup the spiders read from the real site:
+
+- ``/store/apps/category/<CATEGORY>``: the ``ct|apps_topselling_free`` /
+  ``ct|apps_topgrossing`` / ``ct|apps_topselling_paid`` tab buttons, an
+  ``IgeFAf`` ranking section that is re-rendered when a tab is clicked, and
+  the ``zuJxTd`` / ``VfPpkd`` link lists.
+- ``/store/apps/details?id=<package>``: the title heading, rating and
+  download counters, JSON-LD, the embedded "ds:5" data, the ``lpwuxb``
+  arrow button opening the "About this app" dialog and the "See all reviews"
+  dialog with ``h3YV2d`` review blocks.
+
+Every page is generated from the package id, so runs are repeatable. The
+dialogs and tab switches render after RENDER_DELAY milliseconds to mimic the
+asynchronous rendering of the real site.
+
+Run it on its own with ``python -m benchmarks.server --port 8800``.
+"""
+
+import argparse
+import html
+import json
+import random
+import threading
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+RANKING_TABS = {
+    "free": "ct|apps_topselling_free",
+    "grossing": "ct|apps_topgrossing",
+    "paid": "ct|apps_topselling_paid",
+}
+
+# Reviews added to the reviews dialog each time it is scrolled to the bottom
+REVIEWS_PER_LOAD = 20
+
+PAGE_SCRIPT = """
+var RENDER_DELAY = %(render_delay)d;
+var CHARTS = %(charts)s;
+var REVIEWS = %(reviews)s;
+var shownReviews = 0;
+
+function appCard(app) {
+    return '<div class="ULeU3b neq64b"><div jscontroller="tKHFxf">'
+        + '<a href="' + app.link + '"><div class="ubGTjb">' + app.title
+        + '</div></a></div></div>';
+}
+
+function showTab(tab) {
+    setTimeout(function () {
+        document.getElementById("ranking").innerHTML =
+            CHARTS[tab].map(appCard).join("");
+    }, RENDER_DELAY);
+}
+
+function openDialog(id) {
+    setTimeout(function () {
+        document.getElementById(id).style.display = "block";
+        if (id === "reviews" && shownReviews === 0) {
+            loadReviews();
+        }
+    }, RENDER_DELAY);
+}
+
+function reviewBlock(review) {
+    return '<div class="RHo1pe" data-review-id="' + review.id + '"><header>'
+        + '<div class="X5PpBb">' + review.name + '</div>'
+        + '<div class="Jx4nYe"><div class="iXRFPc" role="img" aria-label="Rated '
+        + review.rating + ' stars out of five stars"></div>'
+        + '<span class="bp9Aid">' + review.date + '</span></div></header>'
+        + '<div class="h3YV2d">' + review.text + '</div></div>';
+}
+
+function loadReviews() {
+    var batch = REVIEWS.slice(shownReviews, shownReviews + %(per_load)d);
+    shownReviews += batch.length;
+    document.getElementById("review-list").insertAdjacentHTML(
+        "beforeend", batch.map(reviewBlock).join("")
+    );
+}
+
+function onReviewsScroll(list) {
+    if (list.scrollTop + list.clientHeight >= list.scrollHeight - 10) {
+        setTimeout(loadReviews, RENDER_DELAY);
+    }
+}
+"""
+
+
+def set_path(data, path, value):
+    """Store ``value`` at ``path`` in nested lists, growing them as needed."""
+    for position, index in enumerate(path):
+        while len(data) <= index:
+            data.append(None)
+        if position == len(path) - 1:
+            data[index] = value
+        else:
+            if not isinstance(data[index], list):
+                data[index] = []
+            data = data[index]
+
+
+class SyntheticStore:
+    """Generates the pages of the stand-in Play Store."""
+
+    def __init__(
+        self,
+        categories=2,
+        apps_per_tab=10,
+        reviews_per_app=40,
+        render_delay=50,
+        embedded_data=True,
+        seed=0,
+    ):
+        self.categories = [f"BENCH_CATEGORY_{i}" for i in range(categories)]
+        self.apps_per_tab = apps_per_tab
+        self.reviews_per_app = reviews_per_app
+        self.render_delay = render_delay
+        self.embedded_data = embedded_data
+        self.seed = seed
+
+    def category_url(self, base_url, category):
+        return f"{base_url}/store/apps/category/{category}"
+
+    def package_id(self, category, tab, position):
+        return f"com.bench.{category.lower()}.{tab}{position}"
+
+    def charts(self, category):
+        """Return the apps listed under each ranking tab of ``category``."""
+        charts = {}
+        for tab in RANKING_TABS:
+            charts[tab] = []
+            for position in range(self.apps_per_tab):
+                package_id = self.package_id(category, tab, position)
+                charts[tab].append(
+                    {
+                        "title": self.app(package_id)["title"],
+                        "link": f"/store/apps/details?id={package_id}",
+                    }
+                )
+        return charts
+
+    def app(self, package_id):
+        """Return the synthetic details of an app."""
+        rng = random.Random(f"{self.seed}:{package_id}")
+        paid = ".paid" in package_id
+        return {
+            "title": f"Bench App {package_id.rsplit('.', 1)[-1]} ({package_id})",
+            "rating": round(rng.uniform(1, 5), 1),
+            "review_count": rng.randint(10, 900),
+            "downloads": rng.choice(["1K+", "10K+", "100K+", "1M+", "10M+"]),
+            "age": rng.choice(["3+", "7+", "12+", "16+", "18+"]),
+            "version": f"{rng.randint(1, 9)}.{rng.randint(0, 20)}.{rng.randint(0, 99)}",
+            "android": f"{rng.randint(5, 10)}.0 and up",
+            "updated": 1_700_000_000 + rng.randint(0, 30_000_000),
+            "ads": rng.random() < 0.5,
+            "iap": rng.random() < 0.5,
+            "price": f"${rng.randint(1, 20)}.99" if paid else None,
+        }
+
+    def reviews(self, package_id):
+        rng = random.Random(f"{self.seed}:{package_id}:reviews")
+        months = ["January", "February", "March", "April", "May", "June"]
+        return [
+            {
+                "id": f"{package_id}-r{i}",
+                "name": f"Reviewer {rng.randint(1, 10_000)}",
+                "rating": rng.randint(1, 5),
+                "date": f"{months[i % len(months)]} {1 + i % 28}, 2025",
+                "text": f"Synthetic review {i} of {package_id}.",
+            }
+            for i in range(self.reviews_per_app)
+        ]
+
+    def script(self, charts=None, reviews=None):
+        return PAGE_SCRIPT % {
+            "render_delay": self.render_delay,
+            "charts": json.dumps(charts or {}),
+            "reviews": json.dumps(reviews or []),
+            "per_load": REVIEWS_PER_LOAD,
+        }
+
+    def category_page(self, category):
+        charts = self.charts(category)
+        buttons = "".join(
+            f'<div id="{button_id}" role="tab" onclick="showTab(\'{tab}\')">{tab}</div>'
+            for tab, button_id in RANKING_TABS.items()
+        )
+        links = "".join(
+            f'<a href="{app["link"]}">{html.escape(app["title"])}</a>'
+            for apps in charts.values()
+            for app in apps
+        )
+        cards = "".join(
+            '<div class="ULeU3b neq64b"><div jscontroller="tKHFxf">'
+            f'<a href="{app["link"]}"><div class="ubGTjb">'
+            f'{html.escape(app["title"])}</div></a></div></div>'
+            for app in charts["free"]
+        )
+        return f"""<!DOCTYPE html>
+<html><head><title>{category}</title></head>
+<body id="yDmH0d">
+<div role="tablist">{buttons}</div>
+<section jscontroller="IgeFAf"><div id="ranking">{cards}</div></section>
+<div class="zuJxTd VfPpkd">{links}</div>
+<script>{self.script(charts=charts)}</script>
+</body></html>"""
+
+    def app_page(self, package_id):
+        app = self.app(package_id)
+        title = html.escape(app["title"])
+        updated = self.format_date(app["updated"])
+
+        if app["price"]:
+            button = f'<button aria-label="{app["price"]} Buy">{app["price"]}</button>'
+        else:
+            button = '<button aria-label="Install">Install</button>'
+
+        ads_line = ", ".join(
+            label
+            for label, shown in (
+                ("Contains ads", app["ads"]),
+                ("In-app purchases", app["iap"]),
+            )
+            if shown
+        )
+        ads = f'<span class="UIuSk">{ads_line}</span>' if ads_line else ""
+        iap = "$0.99 - $9.99 per item" if app["iap"] else "None"
+
+        json_ld = {
+            "@type": "SoftwareApplication",
+            "name": app["title"],
+            "contentRating": f"Rated for {app['age']}",
+            "aggregateRating": {
+                "ratingValue": str(app["rating"]),
+                "ratingCount": str(app["review_count"]),
+            },
+            "offers": [
+                {
+                    "price": app["price"].lstrip("$") if app["price"] else "0",
+                    "priceCurrency": "USD",
+                }
+            ],
+        }
+
+        embedded = ""
+        if self.embedded_data:
+            data = []
+            set_path(data, (1, 2, 140, 0, 0, 0), app["version"])
+            set_path(data, (1, 2, 140, 1, 1, 0, 0, 1), app["android"])
+            set_path(data, (1, 2, 145, 0, 1, 0), app["updated"])
+            set_path(data, (1, 2, 19, 0), iap)
+            embedded = (
+                "<script>AF_initDataCallback({key: 'ds:5', hash: '1', "
+                f"data:{json.dumps(data)}, sideChannel: {{}}}});</script>"
+            )
+
+        return f"""<!DOCTYPE html>
+<html><head><title>{title}</title>
+<script type="application/ld+json">{json.dumps(json_ld)}</script>
+{embedded}
+</head>
+<body id="yDmH0d">
+<h1><span itemprop="name">{title}</span></h1>
+<div class="wVqUob"><div class="ClM7O"><div class="TT9eCd" aria-label="Rated {app["rating"]} stars out of five stars">{app["rating"]}</div></div><div class="g1rdde">{app["review_count"]} reviews</div></div>
+<div class="wVqUob"><div class="ClM7O">{app["downloads"]}</div><div class="g1rdde">Downloads</div></div>
+<span itemprop="contentRating"><span>Rated for {app["age"]}</span></span>
+{ads}
+<div class="u4ICaf">{button}</div>
+<div class="VMq4uf"><div jscontroller="lpwuxb"><button onclick="openDialog('about')">About this app</button></div></div>
+<div><div>Updated on</div><div class="xg1aie">{updated}</div></div>
+<button jscontroller="soHxf" onclick="openDialog('reviews')"><span>See all reviews</span></button>
+<div role="dialog" id="about" style="display:none">
+<div class="sMUprd"><div class="q078ud">Version</div><div class="reAt0">{app["version"]}</div></div>
+<div class="sMUprd"><div class="q078ud">Updated on</div><div class="reAt0">{updated}</div></div>
+<div class="sMUprd"><div class="q078ud">Requires Android</div><div class="reAt0">{app["android"]}</div></div>
+<div class="sMUprd"><div class="q078ud">In-app purchases</div><div class="reAt0">{iap}</div></div>
+</div>
+<div role="dialog" id="reviews" style="display:none">
+<div class="fysCi" id="review-list" style="height:600px;overflow-y:auto" onscroll="onReviewsScroll(this)"></div>
+</div>
+<script>{self.script(reviews=self.reviews(package_id))}</script>
+</body></html>"""
+
+    @staticmethod
+    def format_date(timestamp):
+        updated = datetime.fromtimestamp(timestamp, tz=timezone.utc)
+        return f"{updated:%b} {updated.day}, {updated.year}"
+
+
+class StoreRequestHandler(BaseHTTPRequestHandler):
+    """Serve the pages of ``self.server.store``."""
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        store = self.server.store
+
+        if url.path.startswith("/store/apps/category/"):
+            category = url.path.rsplit("/", 1)[-1]
+            if category not in store.categories:
+                return self.send_error(404)
+            body = store.category_page(category)
+        elif url.path == "/store/apps/details":
+            package_id = parse_qs(url.query).get("id", [None])[0]
+            if not package_id:
+                return self.send_error(404)
+            body = store.app_page(package_id)
+        else:
+            return self.send_error(404)
+
+        with self.server.lock:
+            self.server.requests_served += 1
+
+        data = body.encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_server(store, host="127.0.0.1", port=0):
+    """Serve ``store`` from a background thread and return the server.
+
+    With ``port=0`` a free port is picked; read it from ``server.server_port``.
+    """
+    server = ThreadingHTTPServer((host, port), StoreRequestHandler)
+    server.daemon_threads = True
+    server.store = store
+    server.lock = threading.Lock()
+    server.requests_served = 0
+    threading.Thread(
+        target=server.serve_forever, name="bench-server", daemon=True
+    ).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--port", type=int, default=8800)
+    parser.add_argument("--categories", type=int, default=2)
+    parser.add_argument("--apps-per-tab", type=int, default=10)
+    parser.add_argument("--reviews-per-app", type=int, default=40)
+    parser.add_argument("--render-delay", type=int, default=50)
+    args = parser.parse_args()
+
+    store = SyntheticStore(
+        categories=args.categories,
+        apps_per_tab=args.apps_per_tab,
+        reviews_per_app=args.reviews_per_app,
+        render_delay=args.render_delay,
+    )
+    server = start_server(store, port=args.port)
+    base_url = f"http://127.0.0.1:{server.server_port}"
+    for category in store.categories:
+        print(store.category_url(base_url, category))
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
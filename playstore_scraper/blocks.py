@@ -0,0 +1,168 @@
+"""
+Detection of pages the Play Store served instead of the one requested.
+
+A blocked page is one of:
+
+- "captcha": Google's "unusual traffic" check, or a reCAPTCHA form;
+- "consent": the cookie consent page;
+- "interstitial": a rate-limit or error page in place of the content;
+- "empty": a rendered page with (almost) no text.
+
+BlockDetector checks rendered pages right after ``driver.get``, before the
+page action runs, and plain HTTP responses in BlockDetectionMiddleware. A
+blocked request is counted under ``blocks/<type>`` in the crawl stats and
+scheduled again after an exponential backoff of BLOCK_RETRY_DELAY,
+2 * BLOCK_RETRY_DELAY, ... seconds (at most BLOCK_MAX_RETRY_DELAY), up to
+BLOCK_MAX_RETRIES times. Requests wait out their backoff outside the
+downloader, so they do not hold a download slot. The browser that saw a block
+is kept out of use for BLOCK_BROWSER_COOLDOWN seconds.
+"""
+
+import random
+
+from scrapy.exceptions import IgnoreRequest
+
+# Lower-case markers in the URL a request ended up on
+URL_MARKERS = {
+    "captcha": ("google.com/sorry",),
+    "consent": ("consent.google.com", "consent.youtube.com"),
+}
+
+# Lower-case markers in the page text (rendered pages) or HTML (responses)
+TEXT_MARKERS = {
+    "captcha": ("unusual traffic from your computer network", "captcha-form"),
+    "consent": ("before you continue to google",),
+}
+
+# Markers of error pages. Reviews and descriptions may use the same words, so
+# they only count on pages shorter than SHORT_PAGE_LENGTH.
+INTERSTITIAL_MARKERS = ("too many requests", "error 429", "automated queries")
+SHORT_PAGE_LENGTH = 5000
+
+# HTTP statuses returned instead of a page
+STATUS_BLOCKS = {429: "interstitial", 503: "interstitial"}
+
+# Rendered pages with less visible text than this are empty
+EMPTY_TEXT_LENGTH = 20
+
+PAGE_SIGNALS_SCRIPT = """
+return {
+    url: location.href,
+    text: document.body ? document.body.innerText.slice(0, arguments[0]) : "",
+    captcha: !!document.querySelector(
+        "form#captcha-form, .g-recaptcha, iframe[src*='recaptcha']"
+    ),
+};
+"""
+
+
+def classify_page(url, text, status=200, captcha_element=False, rendered=False):
+    """Return the block type of a page, or None if it looks like real content.
+
+    ``text`` is the visible text of a rendered page, or the HTML of a plain
+    response. Only rendered pages can be "empty".
+    """
+    if captcha_element:
+        return "captcha"
+    url = (url or "").lower()
+    for block, markers in URL_MARKERS.items():
+        if any(marker in url for marker in markers):
+            return block
+    if status in STATUS_BLOCKS:
+        return STATUS_BLOCKS[status]
+
+    lowered = (text or "").lower()
+    for block, markers in TEXT_MARKERS.items():
+        if any(marker in lowered for marker in markers):
+            return block
+    if len(lowered) < SHORT_PAGE_LENGTH and any(
+        marker in lowered for marker in INTERSTITIAL_MARKERS
+    ):
+        return "interstitial"
+    if rendered and len(lowered.strip()) < EMPTY_TEXT_LENGTH:
+        return "empty"
+    return None
+
+
+class RetryLater(IgnoreRequest):
+    """Raised for a blocked request that will be scheduled again after a delay.
+
+    Errbacks should not treat it as a failure of the request.
+    """
+
+
+class BlockDetector:
+    """Recognise blocked pages and build their delayed retries."""
+
+    def __init__(
+        self,
+        retry_delay=30.0,
+        max_retry_delay=600.0,
+        max_retries=5,
+        browser_cooldown=60.0,
+        stats=None,
+    ):
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.max_retries = max_retries
+        self.browser_cooldown = browser_cooldown
+        self.stats = stats
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        # One detector per crawler, shared by both middlewares
+        if getattr(crawler, "block_detector", None) is None:
+            settings = crawler.settings
+            crawler.block_detector = cls(
+                retry_delay=settings.getfloat("BLOCK_RETRY_DELAY", 30),
+                max_retry_delay=settings.getfloat("BLOCK_MAX_RETRY_DELAY", 600),
+                max_retries=settings.getint("BLOCK_MAX_RETRIES", 5),
+                browser_cooldown=settings.getfloat("BLOCK_BROWSER_COOLDOWN", 60),
+                stats=crawler.stats,
+            )
+        return crawler.block_detector
+
+    def check_driver(self, driver):
+        """Return the block type of the page loaded in ``driver``, or None."""
+        signals = driver.execute_script(PAGE_SIGNALS_SCRIPT, SHORT_PAGE_LENGTH) or {}
+        return classify_page(
+            signals.get("url"),
+            signals.get("text"),
+            captcha_element=signals.get("captcha", False),
+            rendered=True,
+        )
+
+    def check_response(self, response):
+        """Return the block type of a plain HTTP response, or None."""
+        text = response.text if hasattr(response, "text") else ""
+        return classify_page(response.url, text, status=response.status)
+
+    def retry(self, request, block, spider):
+        """Return ``request`` to be tried again after its backoff delay.
+
+        Raises IgnoreRequest once the request was blocked BLOCK_MAX_RETRIES
+        times.
+        """
+        self.inc_stat(block)
+        attempt = request.meta.get("block_retries", 0) + 1
+        if attempt > self.max_retries:
+            self.inc_stat("gave_up")
+            raise IgnoreRequest(
+                f"Blocked ({block}) {attempt - 1} times: {request.url}"
+            )
+
+        delay = min(self.max_retry_delay, self.retry_delay * 2 ** (attempt - 1))
+        # Spread retries out so blocked pages do not all come back together
+        delay *= random.uniform(1.0, 1.25)
+        spider.logger.warning(
+            f"Blocked ({block}) on {request.url}, retry {attempt} in {delay:.0f}s"
+        )
+        self.inc_stat("retried")
+        return request.replace(
+            dont_filter=True,
+            meta=dict(request.meta, block_retries=attempt, retry_delay=delay),
+        )
+
+    def inc_stat(self, name):
+        if self.stats is not None:
+            self.stats.inc_value(f"blocks/{name}")
@@ -0,0 +1,351 @@
+"""
+Shared Selenium helpers.
+
+Spiders and middlewares obtain their Chrome instances from here instead of
+building them inline, so every browser in a crawl is configured the same way.
+The configuration is a BrowserProfile, read from the BROWSER_* settings.
+Selenium's webdriver package is only imported when the first browser starts.
+"""
+
+import os
+import queue
+import threading
+
+from selenium.common.exceptions import WebDriverException
+from urllib3.exceptions import HTTPError
+
+
+# URL patterns (Network.setBlockedURLs syntax, "*" is a wildcard) for the
+# resource types a BrowserProfile can block. Images are also switched off
+# through a content setting, which covers images without a file extension.
+RESOURCE_TYPE_PATTERNS = {
+    "image": [
+        "*.png",
+        "*.jpg",
+        "*.jpeg",
+        "*.gif",
+        "*.webp",
+        "*.svg",
+        "*.ico",
+        "*play-lh.googleusercontent.com*",
+    ],
+    "font": [
+        "*.woff",
+        "*.woff2",
+        "*.ttf",
+        "*.otf",
+        "*fonts.gstatic.com*",
+        "*fonts.googleapis.com*",
+    ],
+    "media": [
+        "*.mp4",
+        "*.webm",
+        "*.m3u8",
+        "*googlevideo.com*",
+        "*youtube.com/embed*",
+        "*ytimg.com*",
+    ],
+    "stylesheet": ["*.css"],
+}
+
+
+class BrowserProfile:
+    """How every Chrome instance of a crawl is started.
+
+    ``headless`` runs Chrome without a window. ``page_load_strategy`` is the
+    WebDriver strategy: "eager" returns from ``driver.get`` once the DOM is
+    parsed, and the readiness waits cover the rest. Requests of the
+    ``block_resources`` types (keys of RESOURCE_TYPE_PATTERNS) or matching
+    ``block_url_patterns`` are blocked through the DevTools protocol. Empty
+    lists turn blocking off. A page that takes more than
+    ``page_load_timeout`` seconds to load raises a TimeoutException.
+    """
+
+    def __init__(
+        self,
+        headless=True,
+        page_load_strategy="eager",
+        block_resources=(),
+        block_url_patterns=(),
+        window_size="1920,1080",
+        page_load_timeout=30,
+    ):
+        unknown = set(block_resources) - set(RESOURCE_TYPE_PATTERNS)
+        if unknown:
+            raise ValueError(f"Unknown resource types to block: {sorted(unknown)}")
+
+        self.headless = headless
+        self.page_load_strategy = page_load_strategy
+        self.block_resources = list(block_resources)
+        self.block_url_patterns = list(block_url_patterns)
+        self.window_size = window_size
+        self.page_load_timeout = page_load_timeout
+
+    @classmethod
+    def from_settings(cls, settings):
+        return cls(
+            headless=settings.getbool("BROWSER_HEADLESS", True),
+            page_load_strategy=settings.get("BROWSER_PAGE_LOAD_STRATEGY") or "normal",
+            block_resources=settings.getlist("BROWSER_BLOCK_RESOURCES"),
+            block_url_patterns=settings.getlist("BROWSER_BLOCK_URL_PATTERNS"),
+            window_size=settings.get("BROWSER_WINDOW_SIZE", "1920,1080"),
+            page_load_timeout=settings.getfloat("BROWSER_PAGE_LOAD_TIMEOUT", 30),
+        )
+
+    def options(self):
+        """Return the Chrome options of this profile."""
+        from selenium.webdriver.chrome.options import Options
+
+        chrome_options = Options()
+        chrome_options.add_argument("--disable-gpu")
+        chrome_options.add_argument("--no-sandbox")
+        if self.headless:
+            chrome_options.add_argument("--headless=new")
+        if self.window_size:
+            # Headless Chrome defaults to 800x600, where Play serves a
+            # narrower layout
+            chrome_options.add_argument(f"--window-size={self.window_size}")
+        chrome_options.page_load_strategy = self.page_load_strategy
+        if "image" in self.block_resources:
+            chrome_options.add_experimental_option(
+                "prefs", {"profile.managed_default_content_settings.images": 2}
+            )
+        return chrome_options
+
+    def blocked_urls(self):
+        """Return every URL pattern blocked by this profile."""
+        patterns = []
+        for resource_type in self.block_resources:
+            patterns.extend(RESOURCE_TYPE_PATTERNS[resource_type])
+        patterns.extend(self.block_url_patterns)
+        return patterns
+
+    def create_driver(self):
+        """Start a Chrome WebDriver with this profile."""
+        from selenium import webdriver
+
+        driver = webdriver.Chrome(options=self.options())
+        if self.page_load_timeout:
+            driver.set_page_load_timeout(self.page_load_timeout)
+        blocked = self.blocked_urls()
+        if blocked:
+            driver.execute_cdp_cmd("Network.enable", {})
+            driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": blocked})
+        return driver
+
+
+def create_driver(profile=None):
+    """Create a Chrome WebDriver, with the default BrowserProfile if none given."""
+    return (profile or BrowserProfile()).create_driver()
+
+
+class DriverPool:
+    """A bounded pool of WebDriver instances shared between worker threads.
+
+    Browsers are started on demand, up to ``size`` of them. A caller that
+    finds every browser busy blocks in ``acquire`` until one is released.
+
+    A browser is recycled (quit, and replaced on the next ``acquire``) once it
+    has rendered ``max_pages`` pages or its processes use more than
+    ``max_rss`` bytes of memory. Zero disables either limit.
+    """
+
+    def __init__(
+        self, size=1, factory=create_driver, max_pages=0, max_rss=0, stats=None
+    ):
+        self.size = max(1, size)
+        self.factory = factory
+        self.max_pages = max_pages
+        self.max_rss = max_rss
+        self.stats = stats
+        self._idle = queue.LifoQueue()
+        self._drivers = []
+        self._pages = {}
+        # One slot per browser that may be in use, so a caller waiting for a
+        # browser can start a new one when another is discarded
+        self._slots = threading.BoundedSemaphore(self.size)
+        self._lock = threading.Lock()
+
+    def acquire(self, timeout=None):
+        """Return an idle driver, starting a new one if the pool is not full.
+
+        Raises ``queue.Empty`` if no driver became available within
+        ``timeout`` seconds.
+        """
+        if not self._slots.acquire(timeout=timeout):
+            raise queue.Empty
+
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        try:
+            driver = self.factory()
+        except Exception:
+            self._slots.release()
+            raise
+        with self._lock:
+            self._drivers.append(driver)
+            self._pages[driver] = 0
+        return driver
+
+    def warm(self, count=1):
+        """Start browsers ahead of the first page, up to ``count`` in the pool."""
+        started = []
+        try:
+            while len(self._drivers) < min(count, self.size):
+                if not self._slots.acquire(blocking=False):
+                    break
+                try:
+                    driver = self.factory()
+                except Exception:
+                    self._slots.release()
+                    raise
+                with self._lock:
+                    self._drivers.append(driver)
+                    self._pages[driver] = 0
+                started.append(driver)
+        finally:
+            for driver in started:
+                self._idle.put(driver)
+                self._slots.release()
+        return len(started)
+
+    def release(self, driver):
+        """Hand a driver back to the pool after it rendered a page."""
+        reason = self.recycle_reason(driver)
+        if reason:
+            self.discard(driver, reason)
+            return
+        self._idle.put(driver)
+        self._slots.release()
+
+    def cool_down(self, driver, seconds):
+        """Hand a driver back to the pool only after ``seconds``.
+
+        Until then its place stays taken, so the pool runs one browser short
+        instead of starting another.
+        """
+        if self.stats is not None:
+            self.stats.inc_value("browser/cooldowns")
+        timer = threading.Timer(seconds, self.release, args=(driver,))
+        timer.daemon = True
+        timer.start()
+
+    def recycle_reason(self, driver):
+        """Return why ``driver`` should be replaced, or None to keep it."""
+        with self._lock:
+            pages = self._pages[driver] = self._pages.get(driver, 0) + 1
+        if self.max_pages and pages >= self.max_pages:
+            return "pages"
+        if self.max_rss:
+            rss = driver_rss(driver)
+            if rss is not None and rss > self.max_rss:
+                return "memory"
+        return None
+
+    def discard(self, driver, reason):
+        """Quit a driver that was acquired and free its place in the pool.
+
+        ``reason`` ("pages", "memory", "crashed", "hung") is counted in the
+        ``browser/discarded/*`` stats.
+        """
+        with self._lock:
+            if driver in self._drivers:
+                self._drivers.remove(driver)
+            self._pages.pop(driver, None)
+        if self.stats is not None:
+            self.stats.inc_value(f"browser/discarded/{reason}")
+
+        # A hung browser may not answer quit() either, so the caller does not
+        # wait for it
+        threading.Thread(target=quit_driver, args=(driver,), daemon=True).start()
+        self._slots.release()
+
+    def close(self):
+        """Quit every browser owned by the pool."""
+        with self._lock:
+            drivers, self._drivers = self._drivers, []
+            self._pages.clear()
+        for driver in drivers:
+            quit_driver(driver)
+
+
+def quit_driver(driver):
+    try:
+        driver.quit()
+    except Exception:
+        pass
+
+
+# Parts of WebDriverException messages for a browser or tab that is gone
+CRASH_MARKERS = (
+    "invalid session id",
+    "session deleted",
+    "chrome not reachable",
+    "disconnected",
+    "tab crashed",
+    "target crashed",
+    "no such window",
+)
+
+
+def browser_crashed(exc):
+    """Return True if ``exc`` means the browser or its tab is gone.
+
+    Other WebDriver errors come from the page itself, after which the browser
+    can be reused.
+    """
+    if isinstance(exc, (ConnectionError, HTTPError)):
+        # chromedriver is gone
+        return True
+    if isinstance(exc, WebDriverException):
+        message = (exc.msg or "").lower()
+        return any(marker in message for marker in CRASH_MARKERS)
+    return False
+
+
+def driver_rss(driver):
+    """Return the memory used by a driver's chromedriver and Chrome processes.
+
+    This is the sum of their resident set sizes in bytes, which counts memory
+    shared between Chrome processes more than once. Returns None when it
+    cannot be measured (no /proc, or a remote driver).
+    """
+    try:
+        pid = driver.service.process.pid
+    except AttributeError:
+        return None
+    return process_tree_rss(pid)
+
+
+def process_tree_rss(pid):
+    """Return the resident memory in bytes of ``pid`` and its descendants."""
+    if not os.path.isdir("/proc"):
+        return None
+
+    children = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                stat = f.read()
+        except OSError:
+            continue
+        # The command name in parentheses may itself contain spaces
+        ppid = int(stat.rsplit(")", 1)[1].split()[1])
+        children.setdefault(ppid, []).append(int(entry))
+
+    page_size = os.sysconf("SC_PAGE_SIZE")
+    total, pending = 0, [pid]
+    while pending:
+        current = pending.pop()
+        try:
+            with open(f"/proc/{current}/statm") as f:
+                total += int(f.read().split()[1]) * page_size
+        except OSError:
+            continue
+        pending.extend(children.get(current, ()))
+    return total
@@ -1,49 +1,197 @@
 import sqlite3
+import time
+
+from playstore_scraper.extractors import review_hash
+from playstore_scraper.normalize import (
+    MISSING,
+    clean_text,
+    parse_count,
+    parse_date,
+    parse_flag,
+    parse_rating,
+)
+
+# Columns written for each app, in insert order
+APP_COLUMNS = (
+    "package_id",
+    "category",
+    "title",
+    "rating",
+    "version",
+    "review_count",
+    "downloads",
+    "age_suitability",
+    "updated_on",
+    "ads",
+    "requires_android",
+    "In_app_purchases",
+    "price",
+    "ranking_category",
+    "scraped_at",
+)
 
 
 class DatabaseManager:
-    def __init__(self, db_name="playstore_data.db"):
-        """Initialize SQLite connection and CSV setup."""
+    def __init__(
+        self,
+        db_name="playstore_data.db",
+        batch_size=500,
+        flush_interval=5.0,
+        read_only=False,
+    ):
+        """Initialize SQLite connection and CSV setup.
+
+        Writes are grouped into transactions. A transaction is committed once
+        ``batch_size`` rows have been written or ``flush_interval`` seconds
+        have passed since the last commit, and always on ``flush``/``close``.
+
+        A ``read_only`` manager only opens an existing database for lookups.
+        It does not create or migrate tables and may be used from any thread.
+        """
         self.db_name = db_name
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.pending_rows = 0
+        self.last_flush = time.monotonic()
+
+        if read_only:
+            self.conn = sqlite3.connect(
+                f"file:{self.db_name}?mode=ro", uri=True, check_same_thread=False
+            )
+            self.cursor = self.conn.cursor()
+            return
 
         # Initialize SQLite database
         self.conn = sqlite3.connect(self.db_name)
+        self.configure_connection()
         self.cursor = self.conn.cursor()
 
         # Initialize tables
         self.create_apps_table()
         self.create_reviews_table()
+        self.create_rankings_table()
+
+    def configure_connection(self):
+        """Tune SQLite for a write-heavy crawl."""
+        # WAL lets readers work while a batch is being written, and NORMAL
+        # only syncs at checkpoints instead of on every commit
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("PRAGMA cache_size=-64000")  # 64 MB
+        self.conn.execute("PRAGMA temp_store=MEMORY")
+        # Workers sharing one crawl (see workqueue.py) write to the same file
+        # and wait for each other's batches
+        self.conn.execute("PRAGMA busy_timeout=30000")
 
     def app_exists_in_playstore(self, title):
         """Check if an app exists in playstore_data.db apps table."""
         self.cursor.execute("SELECT 1 FROM apps WHERE title = ?", (title,))
         return self.cursor.fetchone() is not None
 
-    def create_apps_table(self):
+    def create_apps_table(self, table="apps"):
         """Create the apps table in SQLite if not exists."""
         self.cursor.execute(
-            """
-            CREATE TABLE IF NOT EXISTS apps (
+            f"""
+            CREATE TABLE IF NOT EXISTS {table} (
                 AppID INTEGER PRIMARY KEY AUTOINCREMENT,
+                package_id TEXT,
                 category TEXT,
                 title TEXT,
-                rating TEXT,
+                rating REAL,
                 version TEXT,
-                review_count TEXT,
-                downloads TEXT,
+                review_count INTEGER,
+                downloads INTEGER,
                 age_suitability TEXT,
-                updated_on TEXT,
-                ads TEXT,
+                updated_on TEXT,  -- ISO date, YYYY-MM-DD
+                ads INTEGER,  -- boolean
                 requires_android TEXT,
-                In_app_purchases TEXT,
+                In_app_purchases INTEGER,  -- boolean
                 price TEXT,
-                ranking_category TEXT
+                ranking_category TEXT,
+                scraped_at TEXT  -- UTC ISO timestamp of the last full scrape
             )
 
             """
         )
+        if table == "apps":
+            self.migrate_apps_table()
+
+    def migrate_apps_table(self):
+        """Bring an apps table from an older version up to the current schema."""
+        columns = {
+            row[1]: row[2] for row in self.conn.execute("PRAGMA table_info(apps)")
+        }
+        if "package_id" not in columns:
+            # Databases created before apps were keyed by package id. Their
+            # rows keep a NULL package_id, which the unique index allows.
+            self.cursor.execute("ALTER TABLE apps ADD COLUMN package_id TEXT")
+        if "scraped_at" not in columns:
+            self.cursor.execute("ALTER TABLE apps ADD COLUMN scraped_at TEXT")
+
+        if columns["rating"].upper() != "REAL":
+            self.convert_apps_table()
+        else:
+            # Typed tables written before unknown prices were stored as NULL
+            placeholders = ", ".join("?" for _ in MISSING)
+            for column in ("age_suitability", "price"):
+                self.cursor.execute(
+                    f"UPDATE apps SET {column} = NULL "
+                    f"WHERE {column} IN ({placeholders})",
+                    tuple(MISSING),
+                )
+
+        self.cursor.execute(
+            "CREATE UNIQUE INDEX IF NOT EXISTS idx_apps_package_id ON apps(package_id)"
+        )
+        self.cursor.execute("CREATE INDEX IF NOT EXISTS idx_apps_title ON apps(title)")
+        self.cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_apps_category_downloads "
+            "ON apps(category, downloads)"
+        )
+        self.cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_apps_updated_on ON apps(updated_on)"
+        )
         self.conn.commit()
 
+    def convert_apps_table(self):
+        """Rebuild an all-TEXT apps table with typed columns, keeping AppIDs."""
+        rows = self.conn.execute(
+            f"SELECT AppID, {', '.join(APP_COLUMNS)} FROM apps"
+        ).fetchall()
+
+        self.create_apps_table(table="apps_typed")
+        self.cursor.executemany(
+            f"""
+            INSERT INTO apps_typed (AppID, {', '.join(APP_COLUMNS)})
+            VALUES (?, {', '.join('?' for _ in APP_COLUMNS)})
+            """,
+            [self.typed_app_row(row) for row in rows],
+        )
+
+        # Reviews keep pointing at "apps", which is the typed table again
+        # once it has been renamed
+        self.cursor.execute("DROP TABLE apps")
+        self.cursor.execute("ALTER TABLE apps_typed RENAME TO apps")
+
+    def typed_app_row(self, row):
+        """Convert one row of an all-TEXT apps table to typed values."""
+        app_id, values = row[0], dict(zip(APP_COLUMNS, row[1:]))
+        values.update(
+            {
+                "rating": parse_rating(values["rating"]),
+                "version": clean_text(values["version"]),
+                "age_suitability": clean_text(values["age_suitability"]),
+                "review_count": parse_count(values["review_count"]),
+                "downloads": parse_count(values["downloads"]),
+                "updated_on": parse_date(values["updated_on"]),
+                "ads": parse_flag(values["ads"], "ads"),
+                "requires_android": clean_text(values["requires_android"]),
+                "In_app_purchases": parse_flag(values["In_app_purchases"]),
+                "price": clean_text(values["price"]),
+            }
+        )
+        return (app_id,) + self.app_row(values)
+
     def create_reviews_table(self):
         """Create the reviews table in SQLite if not exists."""
         self.cursor.execute(
@@ -55,38 +203,154 @@ class DatabaseManager:
                 Review TEXT,
                 Review_Date TEXT,
                 Rating INTEGER,
+                review_key TEXT,  -- content hash, see extractors.review_hash
+                play_review_id TEXT,  -- data-review-id of the review card
                 FOREIGN KEY (AppID) REFERENCES apps(AppID) ON DELETE CASCADE
             )
             """
         )
+        self.migrate_reviews_table()
+
+    def migrate_reviews_table(self):
+        """Key the reviews of an older database and drop duplicate reviews."""
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(reviews)")}
+        if "play_review_id" not in columns:
+            if "review_key" not in columns:
+                self.cursor.execute("ALTER TABLE reviews ADD COLUMN review_key TEXT")
+            self.cursor.execute("ALTER TABLE reviews ADD COLUMN play_review_id TEXT")
+            self.backfill_review_keys()
+
+        self.cursor.execute(
+            "CREATE UNIQUE INDEX IF NOT EXISTS idx_reviews_app_key "
+            "ON reviews(AppID, review_key)"
+        )
         self.conn.commit()
 
-    def insert_app_data(self, data):
-        """Insert app data into SQLite"""
+    def backfill_review_keys(self):
+        """Give stored reviews a content-hash key, keeping the first of duplicates.
+
+        Databases keyed by an earlier version hold Play review ids in
+        review_key; those move to play_review_id.
+        """
+        rows = self.conn.execute(
+            """
+            SELECT Review_ID, AppID, Reviewer_Name, Review_Date, Review, review_key
+            FROM reviews ORDER BY Review_ID
+            """
+        ).fetchall()
+
+        keys, duplicates, seen = [], [], set()
+        for review_id, app_id, name, date, text, old_key in rows:
+            key = review_hash(
+                {"reviewer_name": name, "review_date": date, "review_text": text}
+            )
+            if (app_id, key) in seen:
+                duplicates.append((review_id,))
+                continue
+            seen.add((app_id, key))
+            play_id = old_key if old_key and not old_key.startswith("sha1:") else None
+            keys.append((key, play_id, review_id))
+
+        # New keys may equal old keys of other rows until every row is updated
+        self.cursor.execute("DROP INDEX IF EXISTS idx_reviews_app_key")
+        self.cursor.executemany("DELETE FROM reviews WHERE Review_ID = ?", duplicates)
+        self.cursor.executemany(
+            "UPDATE reviews SET review_key = ?, play_review_id = ? WHERE Review_ID = ?",
+            keys,
+        )
+
+    def create_rankings_table(self):
+        """Create the table of app listings per category tab if not exists.
+
+        An app listed in several tabs or categories has a row for each, and
+        every crawl of a category page adds its listings again, so positions
+        can be followed over time.
+        """
         self.cursor.execute(
             """
-            INSERT OR IGNORE INTO apps (category, title, rating, version, review_count, downloads, age_suitability, updated_on, ads,requires_android, In_app_purchases,price,ranking_category)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?,?,?,?,?)
-            """,
-            (
-                data["category"],
-                data["title"],
-                data["rating"],
-                data["version"],
-                data["review_count"],
-                data["downloads"],
-                data["age_suitability"],
-                data["updated_on"],
-                data["ads"],
-                data["requires_android"],
-                data["In_app_purchases"],
-                data["price"],
-                data["ranking_category"],
-            ),
+            CREATE TABLE IF NOT EXISTS app_rankings(
+                package_id TEXT,
+                category TEXT,
+                ranking_category TEXT,  -- the tab, e.g. "Top Free"
+                position INTEGER,  -- 1-based, within the tab
+                crawled_at TEXT,  -- UTC ISO timestamp of the category page crawl
+                PRIMARY KEY (package_id, category, ranking_category, crawled_at)
+            )
+            """
+        )
+        self.cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_app_rankings_tab "
+            "ON app_rankings(category, ranking_category, crawled_at)"
         )
         self.conn.commit()
 
-        return self.get_app_id(data["title"])
+    def insert_rankings(self, category, crawled_at, rankings):
+        """Store the listings of one category page crawl."""
+        self.cursor.executemany(
+            """
+            INSERT OR IGNORE INTO app_rankings
+                (package_id, category, ranking_category, position, crawled_at)
+            VALUES (?, ?, ?, ?, ?)
+            """,
+            [
+                (
+                    ranking["package_id"],
+                    category,
+                    ranking["ranking_category"],
+                    ranking["position"],
+                    crawled_at,
+                )
+                for ranking in rankings
+            ],
+        )
+        self.rows_written(len(rankings))
+
+    def insert_app_data(self, data):
+        """Insert or update an app and return its AppID.
+
+        Apps are keyed by their Play package id: storing an app that is already
+        in the table updates its row in place. A row stored before apps were
+        keyed by package id, which has none, is taken over by the first app
+        stored with the same title.
+        """
+        if data.get("package_id"):
+            self.cursor.execute(
+                """
+                UPDATE apps SET package_id = ?
+                WHERE AppID = (
+                    SELECT AppID FROM apps
+                    WHERE package_id IS NULL AND title = ?
+                    ORDER BY AppID LIMIT 1
+                )
+                AND NOT EXISTS (SELECT 1 FROM apps WHERE package_id = ?)
+                """,
+                (data["package_id"], data.get("title"), data["package_id"]),
+            )
+
+        columns = ", ".join(APP_COLUMNS)
+        placeholders = ", ".join("?" for _ in APP_COLUMNS)
+        updates = ", ".join(
+            f"{column} = excluded.{column}"
+            for column in APP_COLUMNS
+            if column != "package_id"
+        )
+        self.cursor.execute(
+            f"""
+            INSERT INTO apps ({columns})
+            VALUES ({placeholders})
+            ON CONFLICT(package_id) DO UPDATE SET {updates}
+            RETURNING AppID
+            """,
+            self.app_row(data),
+        )
+        app_id = self.cursor.fetchone()[0]
+        self.rows_written(1)
+
+        return app_id
+
+    def app_row(self, data):
+        """Return the apps table values for one app, in column order."""
+        return tuple(data.get(column) for column in APP_COLUMNS)
 
     def get_app_id(self, title):
         # Retrieve the AppID after insertion for linking with reviews
@@ -94,25 +358,96 @@ class DatabaseManager:
         result = self.cursor.fetchone()
         return result[0] if result else None
 
+    def get_app(self, package_id):
+        """Return the stored values of an app as a dict, or None."""
+        self.cursor.execute(
+            f"SELECT {', '.join(APP_COLUMNS)} FROM apps WHERE package_id = ?",
+            (package_id,),
+        )
+        row = self.cursor.fetchone()
+        return dict(zip(APP_COLUMNS, row)) if row else None
+
+    def get_app_id_by_package(self, package_id):
+        """Return the AppID stored for a Play package id, or None."""
+        self.cursor.execute(
+            "SELECT AppID FROM apps WHERE package_id = ?", (package_id,)
+        )
+        result = self.cursor.fetchone()
+        return result[0] if result else None
+
     def insert_review_data(self, app_id, reviews):
-        """Insert review data linked to an app."""
-        # Loop through each review and insert it into the reviews table
-        for review in reviews:
-            reviewer_name = review["reviewer_name"]
-            review_text = review["review_text"]
-            review_date = review["review_date"]
-            rating = review["review_rating"]
-
-            # Insert the review into the reviews table, linking with AppID
-            self.cursor.execute(
-                """
-                INSERT INTO reviews (AppID, Reviewer_Name, Review, Review_Date, Rating)
-                VALUES (?, ?, ?, ?, ?)
-                """,
-                (app_id, reviewer_name, review_text, review_date, rating),
+        """Insert the reviews of an app that are not stored yet.
+
+        Reviews are identified by their content hash (``review_key``, see
+        ``extractors.review_hash``); Play's id of a review is stored next to
+        it. Returns the number of new rows written.
+        """
+        if not reviews:
+            return 0
+
+        rows = [
+            (
+                app_id,
+                review["reviewer_name"],
+                review["review_text"],
+                review["review_date"],
+                review["review_rating"],
+                review.get("review_key") or review_hash(review),
+                review.get("review_id"),
             )
-            self.conn.commit()
+            for review in reviews
+        ]
+
+        changes = self.conn.total_changes
+        self.cursor.executemany(
+            """
+            INSERT INTO reviews
+                (AppID, Reviewer_Name, Review, Review_Date, Rating, review_key,
+                 play_review_id)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(AppID, review_key) DO NOTHING
+            """,
+            rows,
+        )
+        inserted = self.conn.total_changes - changes
+        self.rows_written(inserted)
+        return inserted
+
+    def stored_review_keys(self, package_id, keys):
+        """Return the subset of review ``keys`` already stored for an app."""
+        if not keys:
+            return set()
+        placeholders = ", ".join("?" for _ in keys)
+        self.cursor.execute(
+            f"""
+            SELECT r.review_key FROM reviews r JOIN apps a ON a.AppID = r.AppID
+            WHERE a.package_id = ? AND r.review_key IN ({placeholders})
+            """,
+            (package_id, *keys),
+        )
+        return {row[0] for row in self.cursor.fetchall()}
+
+    def rows_written(self, count):
+        """Commit the open transaction once it is large or old enough."""
+        self.pending_rows += count
+        if (
+            self.pending_rows >= self.batch_size
+            or time.monotonic() - self.last_flush >= self.flush_interval
+        ):
+            self.flush()
+
+    def flush(self):
+        """Commit all pending writes."""
+        self.conn.commit()
+        self.pending_rows = 0
+        self.last_flush = time.monotonic()
+
+    def rollback(self):
+        """Discard all pending writes."""
+        self.conn.rollback()
+        self.pending_rows = 0
 
     def close(self):
-        """Close SQLite connection."""
+        """Flush pending writes and close SQLite connection."""
+        self.flush()
         self.conn.close()
@@ -0,0 +1,293 @@
+"""
+App page extraction.
+
+Batched DOM extraction for rendered Play Store pages, plus a browser-free
+parser for the plain HTTP response of an app page.
+
+A Selenium ``find_element`` or ``.text`` call is one HTTP round trip to
+chromedriver. The helpers here send a whole map of XPaths to the browser in a
+single ``execute_script`` call and get back plain Python values.
+
+XPaths that select an element return its trimmed visible text. XPaths that
+select an attribute (``.../@href``) return the attribute value. Nothing
+matched gives None.
+"""
+
+import hashlib
+import json
+import re
+from datetime import datetime, timezone
+from urllib.parse import parse_qs, urlparse
+
+# Fields shown on an app detail page once the "About this app" dialog is open
+APP_DETAIL_XPATHS = {
+    "title": "//h1/span[contains(@itemprop,'name')]",
+    "rating": "//div[contains(@class,'TT9eCd') and contains(@aria-label, 'Rated')]",
+    "version": "//div[contains(text(), 'Version')]/following-sibling::div",
+    "review_count": "//div[contains(@class,'g1rdde') and contains(text(), 'reviews')]",
+    "downloads": "//div[contains(@class,'wVqUob')] [div[2][contains(text(),'Downloads')]] /div[1]",
+    "Requires_android": "//div[contains(text(), 'Requires Android')]/following-sibling::div",
+    "age_suitability": "//span[@itemprop='contentRating']",
+    "updated_on": "//div[contains(text(), 'Updated on')]/following-sibling::div",
+    "ads": "//span[contains(@class, 'UIuSk')]",
+    "In_app_purchases": "//div[@class='sMUprd'][div[1][contains(text(), 'In-app purchases')]]/div[2]",
+}
+
+# Raw inputs for the price, turned into a single value by parse_price
+PRICE_XPATHS = {
+    "install_button": "//button[contains(@aria-label, 'Install')]/@aria-label",
+    "price_label": "(//div[contains(@class,'u4ICaf')]//button)[1]/@aria-label",
+}
+
+EXTRACT_SCRIPT = """
+var xpaths = arguments[0], containerXpath = arguments[1], limit = arguments[2];
+var start = arguments[3] || 0;
+
+function read(xpath, context) {
+    var node = document.evaluate(
+        xpath, context, null, XPathResult.FIRST_ORDERED_NODE_TYPE, null
+    ).singleNodeValue;
+    if (!node) {
+        return null;
+    }
+    if (node.nodeType === Node.ATTRIBUTE_NODE) {
+        return node.value;
+    }
+    return (node.innerText || node.textContent || "").trim();
+}
+
+function readAll(context) {
+    var record = {};
+    for (var key in xpaths) {
+        record[key] = read(xpaths[key], context);
+    }
+    return record;
+}
+
+if (!containerXpath) {
+    return readAll(document);
+}
+
+var containers = document.evaluate(
+    containerXpath, document, null, XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null
+);
+var count = containers.snapshotLength;
+if (limit) {
+    count = Math.min(count, start + limit);
+}
+var records = [];
+for (var i = start; i < count; i++) {
+    records.push(readAll(containers.snapshotItem(i)));
+}
+return records;
+"""
+
+
+def extract_fields(driver, xpaths):
+    """Evaluate every XPath in ``xpaths`` against the page in one browser call."""
+    return driver.execute_script(EXTRACT_SCRIPT, xpaths, None, None, 0)
+
+
+def extract_records(driver, container_xpath, xpaths, limit=None, start=0):
+    """Return one dict per ``container_xpath`` match, in one browser call.
+
+    The XPaths in ``xpaths`` are evaluated relative to each container, so they
+    should start with ``.``. The first ``start`` containers are skipped.
+    """
+    return driver.execute_script(EXTRACT_SCRIPT, xpaths, container_xpath, limit, start)
+
+
+def parse_price(install_button, price_label):
+    """Turn the install button / buy button labels into a price string.
+
+    Returns None when neither button gives the price.
+    """
+    if install_button:
+        return "Free"
+    if not price_label:
+        return None
+    # The buy button is labelled like "$11.05 Buy"
+    return re.sub(r"\s*Buy\s*", "", price_label).strip() or None
+
+
+def extract_app_details(driver, xpaths=APP_DETAIL_XPATHS):
+    """Read ``xpaths`` and the app price from a rendered app page in one call."""
+    details = extract_fields(driver, dict(xpaths, **PRICE_XPATHS))
+    details["price"] = parse_price(
+        details.pop("install_button"), details.pop("price_label")
+    )
+    return details
+
+
+# Positions of app fields inside the page's embedded "ds:5" data block. Google
+# does not document this structure; a field whose position has moved is simply
+# read as None and left for the browser fallback.
+EMBEDDED_DATA_PATHS = {
+    "version": (1, 2, 140, 0, 0, 0),
+    "Requires_android": (1, 2, 140, 1, 1, 0, 0, 1),
+    "updated_on": (1, 2, 145, 0, 1, 0),
+    "In_app_purchases": (1, 2, 19, 0),
+}
+
+EMBEDDED_DATA_PATTERN = re.compile(
+    r"AF_initDataCallback\(\{key: 'ds:5'.*?data:(?P<data>.*), sideChannel: \{\}\}\);",
+    re.DOTALL,
+)
+
+
+def read_embedded_data(response):
+    """Return the app's embedded "ds:5" data as nested lists, or None."""
+    for script in response.xpath("//script[contains(text(), \"'ds:5'\")]/text()"):
+        match = EMBEDDED_DATA_PATTERN.search(script.get())
+        if not match:
+            continue
+        try:
+            return json.loads(match.group("data"))
+        except ValueError:
+            return None
+    return None
+
+
+def read_path(data, path):
+    """Follow ``path`` through nested lists, returning None if it breaks off."""
+    for index in path:
+        try:
+            data = data[index]
+        except (IndexError, KeyError, TypeError):
+            return None
+    return data
+
+
+def read_json_ld(response):
+    """Return the SoftwareApplication JSON-LD block of an app page, or {}."""
+    for block in response.xpath("//script[@type='application/ld+json']/text()"):
+        try:
+            data = json.loads(block.get())
+        except ValueError:
+            continue
+        if isinstance(data, dict) and data.get("@type") == "SoftwareApplication":
+            return data
+    return {}
+
+
+def parse_app_response(response):
+    """Read app details from a plain (not rendered) app page response.
+
+    Returns the same keys as ``extract_app_details``. Fields that are not
+    present in the static HTML, the JSON-LD block or the embedded data are None.
+    """
+
+    def text(xpath):
+        value = response.xpath(f"normalize-space({xpath})").get()
+        return value or None
+
+    json_ld = read_json_ld(response)
+    aggregate_rating = json_ld.get("aggregateRating") or {}
+    embedded = read_embedded_data(response)
+
+    details = {
+        "title": text("//h1/span[contains(@itemprop,'name')]") or json_ld.get("name"),
+        "rating": None,
+        "version": None,
+        "review_count": text(APP_DETAIL_XPATHS["review_count"])
+        or aggregate_rating.get("ratingCount"),
+        "downloads": text(APP_DETAIL_XPATHS["downloads"]),
+        "Requires_android": None,
+        "age_suitability": text(APP_DETAIL_XPATHS["age_suitability"])
+        or json_ld.get("contentRating"),
+        "updated_on": text(APP_DETAIL_XPATHS["updated_on"])
+        or text("//div[contains(@class, 'xg1aie')]"),
+        "ads": text(APP_DETAIL_XPATHS["ads"]),
+        "In_app_purchases": None,
+    }
+
+    if aggregate_rating.get("ratingValue"):
+        details["rating"] = "%.1f" % float(aggregate_rating["ratingValue"])
+
+    if embedded is not None:
+        for key, path in EMBEDDED_DATA_PATHS.items():
+            if details[key] is None:
+                value = read_path(embedded, path)
+                details[key] = value if isinstance(value, (str, int)) else None
+
+        # The update time is stored as a unix timestamp
+        if isinstance(details["updated_on"], int):
+            updated = datetime.fromtimestamp(details["updated_on"], tz=timezone.utc)
+            details["updated_on"] = f"{updated:%b} {updated.day}, {updated.year}"
+
+    price = parse_price(
+        response.xpath(PRICE_XPATHS["install_button"]).get(),
+        response.xpath(PRICE_XPATHS["price_label"]).get(),
+    )
+    if price is None:
+        offers = json_ld.get("offers") or [{}]
+        offer = offers[0] if isinstance(offers, list) else offers
+        if offer.get("price") in ("0", 0):
+            price = "Free"
+        elif offer.get("price"):
+            price = f"{offer.get('priceCurrency', '')} {offer['price']}".strip()
+    details["price"] = price
+
+    return details
+
+
+# A review card of the "See all reviews" dialog: the element holding the review
+# text, which also holds the reviewer, date and rating of that review
+REVIEW_CONTAINER_XPATH = "//div[@role='dialog']//div[div[@class='h3YV2d']]"
+
+# Reviews shown on the app page itself, outside the dialog
+PAGE_REVIEW_CONTAINER_XPATH = (
+    "//div[div[@class='h3YV2d']][not(ancestor::div[@role='dialog'])]"
+)
+
+# Fields of one review, relative to its card
+REVIEW_XPATHS = {
+    "review_id": ".//@data-review-id",
+    "review_text": "./div[@class='h3YV2d']",
+    "reviewer_name": ".//div[@class='X5PpBb']",
+    "review_date": ".//span[@class='bp9Aid']",
+    "review_rating": ".//div[@class='iXRFPc']/@aria-label",
+}
+
+
+def extract_reviews(driver, start=0, container_xpath=REVIEW_CONTAINER_XPATH):
+    """Read the review cards after the first ``start`` ones in one call.
+
+    Every field is read from inside its own card, so a review without a
+    date or rating cannot shift the other reviews' fields. Missing fields get
+    the placeholders stored in the reviews table. ``review_id`` is the id
+    Play puts on the card, if any, and ``review_key`` the content hash that
+    identifies the review in the reviews table.
+    """
+    reviews = extract_records(driver, container_xpath, REVIEW_XPATHS, start=start)
+    for review in reviews:
+        # The rating is labelled like "Rated 4 stars out of five stars"
+        label = (review["review_rating"] or "").split()
+        review["review_rating"] = label[1] if len(label) > 1 else "No Rating"
+        review["reviewer_name"] = review["reviewer_name"] or "Anonymous"
+        review["review_date"] = review["review_date"] or "Unknown"
+        review["review_key"] = review_hash(review)
+    return reviews
+
+
+def review_hash(review):
+    """Return the content hash identifying a review among those of its app.
+
+    Reviews are keyed by content rather than by their Play id because reviews
+    stored before Play ids were read have none.
+    """
+    key = "\x1f".join(
+        str(value or "")
+        for value in (
+            review.get("reviewer_name"),
+            review.get("review_date"),
+            review.get("review_text"),
+        )
+    )
+    return "sha1:" + hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+
+def package_id_from_url(url):
+    """Return the Play package id (the ``id=`` parameter) of an app URL."""
+    values = parse_qs(urlparse(url).query).get("id")
+    return values[0] if values else None
@@ -0,0 +1,188 @@
+"""
+Persistent crawl frontier for the scrapers spider.
+
+The frontier is an SQLite file (FRONTIER_DB, next to DB_NAME by default) that
+records which category pages have been walked, every app found on them with
+the category and ranking it was first listed under, and which of those apps
+have been stored. An app counts as stored once the database writer has
+committed it, not when its item is scraped.
+Progress is committed every FRONTIER_CHECKPOINT_INTERVAL seconds and when the
+spider closes.
+
+A crawl that ends with the "finished" reason marks the frontier as finished,
+and the next crawl starts from scratch. Any other ending (a crash, Ctrl-C,
+a killed browser host) leaves it "running", and the next crawl resumes: walked
+categories are skipped and only the apps not stored yet are requested again.
+"""
+
+import logging
+import os
+import sqlite3
+
+from scrapy import signals
+from twisted.internet import task
+
+from playstore_scraper.extractors import package_id_from_url
+from playstore_scraper.items import AppItem
+from playstore_scraper.pipelines import items_stored
+
+logger = logging.getLogger(__name__)
+
+
+class CrawlFrontier:
+    """Durable record of the categories and apps of one crawl.
+
+    Used from the reactor thread only: the spider callbacks and the
+    item_scraped and items_stored signals.
+    """
+
+    def __init__(self, path, checkpoint_interval=30.0):
+        self.path = path
+        self.checkpoint_interval = checkpoint_interval
+        self.checkpoint_task = None
+
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.create_tables()
+
+        self.resuming = self.get_state() == "running"
+        if not self.resuming:
+            self.reset()
+        self.set_state("running")
+        self.conn.commit()
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        path = settings.get("FRONTIER_DB") or os.path.join(
+            os.path.dirname(settings.get("DB_NAME", "playstore_data.db")),
+            "playstore_frontier.db",
+        )
+        frontier = cls(
+            path,
+            checkpoint_interval=settings.getfloat("FRONTIER_CHECKPOINT_INTERVAL", 30),
+        )
+        crawler.signals.connect(frontier.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(frontier.spider_closed, signal=signals.spider_closed)
+        crawler.signals.connect(frontier.item_scraped, signal=signals.item_scraped)
+        crawler.signals.connect(frontier.items_stored, signal=items_stored)
+        return frontier
+
+    def create_tables(self):
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS crawl (key TEXT PRIMARY KEY, value TEXT)"
+        )
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS categories (
+                category TEXT PRIMARY KEY,
+                walked_at TEXT
+            )
+            """
+        )
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS apps (
+                package_id TEXT PRIMARY KEY,
+                category TEXT,
+                ranking_category TEXT,
+                url TEXT,
+                done INTEGER DEFAULT 0
+            )
+            """
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_apps_done ON apps(done)")
+
+    def get_state(self):
+        row = self.conn.execute(
+            "SELECT value FROM crawl WHERE key = 'state'"
+        ).fetchone()
+        return row[0] if row else None
+
+    def set_state(self, state):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO crawl (key, value) VALUES ('state', ?)", (state,)
+        )
+
+    def reset(self):
+        """Forget the previous crawl."""
+        self.conn.execute("DELETE FROM categories")
+        self.conn.execute("DELETE FROM apps")
+
+    def category_walked(self, category):
+        """Return True if the apps of ``category`` are already recorded."""
+        row = self.conn.execute(
+            "SELECT 1 FROM categories WHERE category = ?", (category,)
+        ).fetchone()
+        return row is not None
+
+    def add_category(self, category, app_links):
+        """Record the apps found on a category page and mark it as walked.
+
+        ``app_links`` maps each ranking category to absolute app URLs. Apps
+        already recorded keep their first listing.
+        """
+        self.conn.executemany(
+            """
+            INSERT OR IGNORE INTO apps (package_id, category, ranking_category, url)
+            VALUES (?, ?, ?, ?)
+            """,
+            [
+                (package_id_from_url(url), category, ranking_category, url)
+                for ranking_category, urls in app_links.items()
+                for url in urls
+            ],
+        )
+        self.conn.execute(
+            "INSERT OR REPLACE INTO categories (category, walked_at) "
+            "VALUES (?, datetime('now'))",
+            (category,),
+        )
+
+    def known_apps(self):
+        """Return the package ids of every app recorded, stored or not."""
+        return {row[0] for row in self.conn.execute("SELECT package_id FROM apps")}
+
+    def pending_apps(self):
+        """Return (url, category, ranking_category) of the apps not stored yet."""
+        return self.conn.execute(
+            "SELECT url, category, ranking_category FROM apps WHERE done = 0"
+        ).fetchall()
+
+    def complete_app(self, package_id):
+        self.conn.execute(
+            "UPDATE apps SET done = 1 WHERE package_id = ?", (package_id,)
+        )
+
+    def checkpoint(self):
+        """Commit the progress recorded since the last checkpoint."""
+        self.conn.commit()
+
+    def item_scraped(self, item, response, spider):
+        # Without the database writer there is no commit to wait for
+        writer = getattr(spider.crawler, "db_writer", None)
+        if isinstance(item, AppItem) and writer is None:
+            self.complete_app(item.get("package_id"))
+
+    def items_stored(self, items):
+        for item in items:
+            if isinstance(item, AppItem):
+                self.complete_app(item.get("package_id"))
+
+    def spider_opened(self, spider):
+        if self.resuming:
+            logger.info(f"Resuming the unfinished crawl recorded in {self.path}")
+        if self.checkpoint_interval > 0:
+            self.checkpoint_task = task.LoopingCall(self.checkpoint)
+            self.checkpoint_task.start(self.checkpoint_interval, now=False)
+
+    def spider_closed(self, spider, reason):
+        if self.checkpoint_task is not None and self.checkpoint_task.running:
+            self.checkpoint_task.stop()
+
+        # Only a crawl that ran to the end starts over next time
+        if reason == "finished":
+            self.set_state("finished")
+        self.checkpoint()
+        self.conn.close()
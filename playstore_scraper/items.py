@@ -10,3 +10,49 @@ class PlaystoreScraperItem(scrapy.Item):
     # define the fields for your item here like:
     # name = scrapy.Field()
     pass
+
+
+class AppItem(scrapy.Item):
+    """App details, stored as one row of the apps table."""
+
+    package_id = scrapy.Field()
+    category = scrapy.Field()
+    title = scrapy.Field()
+    rating = scrapy.Field()
+    version = scrapy.Field()
+    review_count = scrapy.Field()
+    downloads = scrapy.Field()
+    age_suitability = scrapy.Field()
+    updated_on = scrapy.Field()
+    ads = scrapy.Field()
+    requires_android = scrapy.Field()
+    In_app_purchases = scrapy.Field()
+    price = scrapy.Field()
+    ranking_category = scrapy.Field()
+    scraped_at = scrapy.Field()
+
+
+class AppRankingsItem(scrapy.Item):
+    """The apps listed on one category page, stored in the app_rankings table.
+
+    ``rankings`` holds one dict per listing, with the package_id, the
+    ranking_category (tab) and the 1-based position in that tab.
+    """
+
+    category = scrapy.Field()
+    crawled_at = scrapy.Field()
+    rankings = scrapy.Field()
+
+
+class AppReviewsItem(scrapy.Item):
+    """A chunk of reviews of one app, stored in the reviews table.
+
+    The app is looked up by app_id, else package_id, else title.
+    """
+
+    app_id = scrapy.Field()
+    package_id = scrapy.Field()
+    category = scrapy.Field()
+    title = scrapy.Field()
+    reviews = scrapy.Field()
+    rating = scrapy.Field()
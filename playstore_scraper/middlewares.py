@@ -3,11 +3,26 @@
 # See documentation in:
 # https://docs.scrapy.org/en/latest/topics/spider-middleware.html
 
+import time
+
 from scrapy import signals
+from scrapy.exceptions import DontCloseSpider, IgnoreRequest, NotConfigured
+from scrapy.http import HtmlResponse
+from scrapy.responsetypes import responsetypes
+from twisted.internet import threads
+from twisted.python.threadpool import ThreadPool
 
 # useful for handling different item types with a single interface
 from itemadapter import is_item, ItemAdapter
 
+from selenium.common.exceptions import TimeoutException
+
+from playstore_scraper.blocks import BlockDetector, RetryLater
+from playstore_scraper.browser import BrowserProfile, DriverPool, browser_crashed
+from playstore_scraper.replay import ReplayStore
+from playstore_scraper.throttle import RenderThrottle
+from playstore_scraper.timing import StageTimings
+
 
 class PlaystoreScraperSpiderMiddleware:
     # Not all methods need to be defined. If a method is not defined,
@@ -57,47 +72,354 @@ class PlaystoreScraperSpiderMiddleware:
 
 
 class PlaystoreScraperDownloaderMiddleware:
-    # Not all methods need to be defined. If a method is not defined,
-    # scrapy acts as if the downloader middleware does not modify the
-    # passed objects.
+    """Render requests in a pool of Selenium browsers.
+
+    Requests with ``meta["selenium"]`` set are loaded in one of
+    ``SELENIUM_POOL_SIZE`` Chrome instances on a dedicated thread pool, and
+    the rendered page is returned to Scrapy as an ``HtmlResponse``. If
+    ``meta["selenium_action"]`` names a spider method, it is called as
+    ``method(driver, request)`` once the page is loaded, still on the browser
+    thread; its return value is exposed as ``response.meta["selenium_result"]``.
+    All other requests go through the regular downloader.
+
+    Browsers are started on first use. With ``warmup`` set, that many are
+    started in the background as soon as the spider opens, while the first
+    requests are still being fetched; a host without Chrome only gets a
+    warning, and crawls that never render a page still run.
+
+    Browsers are recycled after ``max_pages`` pages or ``max_rss`` bytes of
+    memory. A browser that crashes, or hangs loading a page, is replaced and
+    the request is scheduled again, up to ``max_retries`` times.
+
+    With a ``throttle`` (see throttle.py), page loads wait for a slot of the
+    RenderThrottle and report their latency and errors back to it.
+
+    With a ``blocks`` detector (see blocks.py), every loaded page is checked
+    for CAPTCHA, consent, interstitial and empty pages before the page action
+    runs. A blocked page cools its browser down, slows the throttle and sends
+    the request back with a backoff delay.
+    """
+
+    def __init__(
+        self,
+        pool_size=1,
+        timings=None,
+        profile=None,
+        max_pages=0,
+        max_rss=0,
+        max_retries=2,
+        stats=None,
+        warmup=0,
+        throttle=None,
+        blocks=None,
+    ):
+        self.pool_size = pool_size
+        self.profile = profile or BrowserProfile()
+        self.pool = DriverPool(
+            size=pool_size,
+            factory=self.profile.create_driver,
+            max_pages=max_pages,
+            max_rss=max_rss,
+            stats=stats,
+        )
+        self.max_retries = max_retries
+        self.stats = stats
+        self.warmup = warmup
+        self.throttle = throttle
+        self.blocks = blocks
+        self.threadpool = ThreadPool(
+            minthreads=0, maxthreads=pool_size, name="selenium"
+        )
+        self.timings = timings or StageTimings()
 
     @classmethod
     def from_crawler(cls, crawler):
-        # This method is used by Scrapy to create your spiders.
-        s = cls()
+        s = cls(
+            pool_size=crawler.settings.getint("SELENIUM_POOL_SIZE", 1),
+            timings=StageTimings.from_crawler(crawler),
+            profile=BrowserProfile.from_settings(crawler.settings),
+            max_pages=crawler.settings.getint("BROWSER_MAX_PAGES", 0),
+            max_rss=crawler.settings.getint("BROWSER_MAX_RSS_MB", 0) * 1024 * 1024,
+            max_retries=crawler.settings.getint("BROWSER_MAX_RETRIES", 2),
+            stats=crawler.stats,
+            # A replayed crawl never reaches a browser
+            warmup=(
+                0
+                if crawler.settings.get("REPLAY_MODE") == "replay"
+                else crawler.settings.getint("BROWSER_WARMUP", 0)
+            ),
+            throttle=(
+                RenderThrottle.from_crawler(crawler)
+                if crawler.settings.getbool("RENDER_THROTTLE_ENABLED")
+                else None
+            ),
+            blocks=(
+                BlockDetector.from_crawler(crawler)
+                if crawler.settings.getbool("BLOCK_DETECTION_ENABLED")
+                else None
+            ),
+        )
         crawler.signals.connect(s.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(s.spider_closed, signal=signals.spider_closed)
         return s
 
     def process_request(self, request, spider):
-        # Called for each request that goes through the downloader
-        # middleware.
-
-        # Must either:
-        # - return None: continue processing this request
-        # - or return a Response object
-        # - or return a Request object
-        # - or raise IgnoreRequest: process_exception() methods of
-        #   installed downloader middleware will be called
-        return None
+        if not request.meta.get("selenium"):
+            return None
 
-    def process_response(self, request, response, spider):
-        # Called with the response returned from the downloader.
+        from twisted.internet import reactor
 
-        # Must either;
-        # - return a Response object
-        # - return a Request object
-        # - or raise IgnoreRequest
-        return response
+        return threads.deferToThreadPool(
+            reactor, self.threadpool, self.render, request, spider
+        )
 
-    def process_exception(self, request, exception, spider):
-        # Called when a download handler or a process_request()
-        # (from other downloader middleware) raises an exception.
+    def render(self, request, spider):
+        """Load ``request`` in a pooled browser. Runs on a browser thread."""
+        if self.throttle is None:
+            return self.render_page(request, spider)
 
-        # Must either:
-        # - return None: continue processing this exception
-        # - return a Response object: stops process_exception() chain
-        # - return a Request object: stops process_exception() chain
-        pass
+        with self.timings.time("throttle_wait"):
+            self.throttle.acquire()
+        try:
+            return self.render_page(request, spider)
+        finally:
+            self.throttle.release()
+
+    def render_page(self, request, spider):
+        with self.timings.time("driver_acquire"):
+            driver = self.pool.acquire()
+
+        problem = block = None
+        try:
+            try:
+                start = time.monotonic()
+                with self.timings.time("driver_get"):
+                    driver.get(request.url)
+                latency = time.monotonic() - start
+            except TimeoutException:
+                problem = "hung"
+                raise
+
+            if self.blocks is not None:
+                with self.timings.time("block_check"):
+                    block = self.blocks.check_driver(driver)
+
+            if block is None:
+                action = request.meta.get("selenium_action")
+                if action:
+                    with self.timings.time(f"action_{action}"):
+                        request.meta["selenium_result"] = getattr(spider, action)(
+                            driver, request
+                        )
+
+                with self.timings.time("page_source"):
+                    body = driver.page_source
+        except Exception as e:
+            if self.throttle is not None:
+                self.throttle.record(error=True)
+            if problem is None and browser_crashed(e):
+                problem = "crashed"
+            if problem is None:
+                self.pool.release(driver)
+                raise
+            self.pool.discard(driver, problem)
+            return self.retry(request, spider, problem, e)
+
+        if block is not None:
+            self.pool.cool_down(driver, self.blocks.browser_cooldown)
+            if self.throttle is not None:
+                self.throttle.record(blocked=True)
+            return self.blocks.retry(request, block, spider)
+
+        self.pool.release(driver)
+        if self.throttle is not None:
+            self.throttle.record(latency)
+        return HtmlResponse(request.url, body=body, encoding="utf-8", request=request)
+
+    def retry(self, request, spider, problem, error):
+        """Schedule ``request`` again after its browser crashed or hung."""
+        retries = request.meta.get("browser_retries", 0)
+        if retries >= self.max_retries:
+            raise error
+
+        spider.logger.warning(
+            f"Browser {problem} on {request.url}, rendering it again in a new browser"
+        )
+        if self.stats is not None:
+            self.stats.inc_value("browser/requeued")
+        return request.replace(
+            dont_filter=True, meta=dict(request.meta, browser_retries=retries + 1)
+        )
 
     def spider_opened(self, spider):
-        spider.logger.info("Spider opened: %s" % spider.name)
+        self.threadpool.start()
+        spider.logger.info(
+            "Spider opened: %s (browser pool size %d)" % (spider.name, self.pool_size)
+        )
+        if self.warmup:
+            from twisted.internet import reactor
+
+            d = threads.deferToThreadPool(
+                reactor, self.threadpool, self.pool.warm, self.warmup
+            )
+            d.addCallbacks(
+                lambda started: spider.logger.debug(f"Warmed up {started} browsers"),
+                lambda failure: spider.logger.warning(
+                    f"Could not start a browser ({failure.getErrorMessage()}); "
+                    "pages that need rendering will fail"
+                ),
+            )
+
+    def spider_closed(self, spider):
+        self.threadpool.stop()
+        self.pool.close()
+
+
+class BlockDetectionMiddleware:
+    """Back off from pages the store blocked (see blocks.py).
+
+    Requests sent back for a block carry a backoff delay. They are taken out
+    of the downloader here, before they reach the network or a browser, and
+    handed back to the engine once the delay is over, so waiting requests do
+    not count against CONCURRENT_REQUESTS. The original request ends with
+    RetryLater, and the spider is kept open while retries are waiting. Their
+    number is in the crawl stats as ``blocks/waiting``.
+
+    Plain HTTP responses are checked for blocks here too; rendered pages are
+    checked in the browser by PlaystoreScraperDownloaderMiddleware. Must run
+    before that middleware (a lower priority number).
+    """
+
+    def __init__(self, detector, crawler):
+        self.detector = detector
+        self.crawler = crawler
+        # Pending reactor calls that hand a waiting request back to the engine
+        self.waiting = set()
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool("BLOCK_DETECTION_ENABLED"):
+            raise NotConfigured
+        middleware = cls(BlockDetector.from_crawler(crawler), crawler)
+        crawler.signals.connect(middleware.spider_idle, signal=signals.spider_idle)
+        crawler.signals.connect(middleware.spider_closed, signal=signals.spider_closed)
+        return middleware
+
+    def process_request(self, request, spider):
+        delay = request.meta.pop("retry_delay", None)
+        if not delay:
+            return None
+
+        from twisted.internet import reactor
+
+        call = reactor.callLater(delay, self.schedule, request)
+        self.waiting.add(call)
+        self.publish()
+        raise RetryLater(f"Retrying {request.url} in {delay:.0f}s")
+
+    def schedule(self, request):
+        self.waiting = {call for call in self.waiting if call.active()}
+        self.publish()
+        self.crawler.engine.crawl(request)
+
+    def publish(self):
+        self.crawler.stats.set_value("blocks/waiting", len(self.waiting))
+
+    def spider_idle(self, spider):
+        if self.waiting:
+            raise DontCloseSpider
+
+    def spider_closed(self, spider):
+        for call in self.waiting:
+            if call.active():
+                call.cancel()
+        self.waiting.clear()
+
+    def process_response(self, request, response, spider):
+        if request.meta.get("selenium") or "replayed" in response.flags:
+            return response
+
+        block = self.detector.check_response(response)
+        if block is None:
+            return response
+        return self.detector.retry(request, block, spider)
+
+
+class ReplayMiddleware:
+    """Record responses to disk, or serve a recording instead of the network.
+
+    With ``REPLAY_MODE = "record"`` every response is saved to a ReplayStore
+    in REPLAY_DIR. For pages rendered by PlaystoreScraperDownloaderMiddleware,
+    this is the rendered DOM plus the page action's result. With
+    ``REPLAY_MODE = "replay"`` requests are answered from the recording,
+    without any network or browser, and requests that were never recorded are
+    dropped. Must run before the Selenium middleware (a lower priority number)
+    so replayed requests never reach a browser.
+    """
+
+    def __init__(self, mode, store, stats):
+        self.mode = mode
+        self.store = store
+        self.stats = stats
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        mode = crawler.settings.get("REPLAY_MODE")
+        if mode not in ("record", "replay"):
+            raise NotConfigured
+        store = ReplayStore(crawler.settings.get("REPLAY_DIR", "replay"))
+        return cls(mode, store, crawler.stats)
+
+    def request_key(self, request, spider):
+        """Key a recording by request fingerprint and how the page was loaded."""
+        key = spider.crawler.request_fingerprinter.fingerprint(request).hex()
+        if request.meta.get("selenium"):
+            key += "-" + request.meta.get("selenium_action", "render")
+        return key
+
+    def process_request(self, request, spider):
+        if self.mode != "replay":
+            return None
+
+        recorded = self.store.load(self.request_key(request, spider))
+        if recorded is None:
+            self.stats.inc_value("replay/missing")
+            raise IgnoreRequest(f"No recording for {request.url}")
+
+        entry, body = recorded
+        if "selenium_result" in entry:
+            request.meta["selenium_result"] = entry["selenium_result"]
+            response_cls = HtmlResponse
+        else:
+            response_cls = responsetypes.from_args(
+                headers=entry["headers"], url=entry["url"], body=body
+            )
+
+        self.stats.inc_value("replay/served")
+        return response_cls(
+            url=entry["url"],
+            status=entry["status"],
+            headers=entry["headers"],
+            body=body,
+            request=request,
+            flags=["replayed"],
+        )
+
+    def process_response(self, request, response, spider):
+        if self.mode != "record":
+            return response
+
+        entry = {
+            "url": response.url,
+            "status": response.status,
+            "headers": {
+                key.decode("latin-1"): [value.decode("latin-1") for value in values]
+                for key, values in response.headers.items()
+            },
+        }
+        if request.meta.get("selenium"):
+            entry["selenium_result"] = request.meta.get("selenium_result")
+
+        self.store.save(self.request_key(request, spider), entry, response.body)
+        self.stats.inc_value("replay/recorded")
+        return response
@@ -0,0 +1,86 @@
+"""
+Conversion of scraped text into the typed values stored in the apps table.
+
+Every helper returns None for a missing value, including the placeholder
+strings older versions of the scraper stored ("Not Available", "No Rating").
+The database migration uses the same helpers on existing rows.
+"""
+
+import re
+from datetime import datetime
+
+# Placeholders stored for missing values before the schema was typed
+MISSING = {"", "None", "Not Available", "No Rating", "No Ad", "No in-app-purchases"}
+
+# Suffix multipliers used in download and review counts
+MULTIPLIERS = {
+    "K": 1_000,
+    "M": 1_000_000,
+    "B": 1_000_000_000,
+    "L": 100_000,  # Lakh
+    "Cr": 10_000_000,  # Crore
+}
+
+COUNT_PATTERN = re.compile(r"(\d[\d,]*(?:\.\d+)?)\s*(Cr|K|M|B|L)?")
+RATING_PATTERN = re.compile(r"\d+(?:\.\d+)?")
+DATE_FORMATS = ("%Y-%m-%d", "%b %d, %Y", "%B %d, %Y", "%Y/%m/%d")
+
+
+def clean_text(value):
+    """Return stripped text, or None for missing values."""
+    if value is None:
+        return None
+    text = str(value).strip()
+    return None if text in MISSING else text
+
+
+def parse_count(value):
+    """Parse counts such as "10M+", "1,234" or "1.2K reviews" to an int."""
+    if isinstance(value, int):
+        return value
+    text = clean_text(value)
+    if text is None:
+        return None
+    match = COUNT_PATTERN.search(text)
+    if not match:
+        return None
+    number = float(match.group(1).replace(",", ""))
+    return int(number * MULTIPLIERS.get(match.group(2), 1))
+
+
+def parse_rating(value):
+    """Parse ratings such as "4.5\\nstar" or "4.5" to a float."""
+    if isinstance(value, (int, float)):
+        return float(value)
+    text = clean_text(value)
+    if text is None:
+        return None
+    match = RATING_PATTERN.search(text)
+    return float(match.group()) if match else None
+
+
+def parse_date(value):
+    """Parse dates such as "Mar 3, 2025" or "2025/03/03" to ISO "2025-03-03"."""
+    text = clean_text(value)
+    if text is None:
+        return None
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.strptime(text, date_format).date().isoformat()
+        except ValueError:
+            continue
+    return None
+
+
+def parse_flag(value, keyword=None):
+    """Turn a text marker into a boolean.
+
+    None stays None (unknown) and placeholders are False. Any other text is
+    True, or, if ``keyword`` is given, True only when it contains ``keyword``.
+    """
+    if value is None:
+        return None
+    text = str(value).strip()
+    if text in MISSING:
+        return False
+    return keyword is None or keyword.lower() in text.lower()
@@ -3,11 +3,287 @@
 # Don't forget to add your pipeline to the ITEM_PIPELINES setting
 # See: https://docs.scrapy.org/en/latest/topics/item-pipeline.html
 
+import logging
+import queue
+import sqlite3
+import threading
+import time
 
 # useful for handling different item types with a single interface
 from itemadapter import ItemAdapter
+from twisted.internet import threads
+
+from playstore_scraper.database import DatabaseManager
+from playstore_scraper.items import AppItem, AppRankingsItem, AppReviewsItem
+from playstore_scraper.timing import StageTimings
+
+logger = logging.getLogger(__name__)
+
+# Queued after the last item to tell the writer thread to finish
+STOP = object()
+
+# Signals sent on the reactor thread once items are committed to the database
+# (with ``items``, a list), or when an item could not be stored (with ``item``
+# and ``error``). Progress records such as the frontier count an app as done
+# only once it is committed.
+items_stored = object()
+item_store_failed = object()
+
+
+class WriterStopped(Exception):
+    """Raised for items handed to a database writer that is no longer running."""
 
 
 class PlaystoreScraperPipeline:
+    """Write app and review items to SQLite from a background thread.
+
+    Callbacks never touch the database: items are put on a bounded queue and a
+    single writer thread, which owns the only writing connection, stores them
+    in batched transactions. When the queue is full, process_item waits for
+    room off the reactor thread, which holds the item back and slows the crawl
+    down to the speed of the writer. Other items pass through unchanged.
+
+    Page actions that stream results, such as the review harvester, hand
+    items to ``submit`` from their browser thread instead of returning them.
+    The pipeline is reachable from a spider as ``self.crawler.db_writer``.
+
+    Workers of a shared crawl (``shared``, see workqueue.py) write to the same
+    database file. Their writers commit every item right away, so no worker
+    holds the write lock for long, and try an item again up to
+    ``busy_retries`` times if another worker holds it.
+
+    Once a commit has made items durable, they are announced with the
+    ``items_stored`` signal. Items that could not be written are announced
+    with ``item_store_failed``.
+
+    The crawl does not start if the writer cannot open the database, and items
+    arriving after the writer stopped raise WriterStopped instead of waiting
+    for room in the queue.
+    """
+
+    def __init__(
+        self,
+        db_name,
+        queue_size=1000,
+        batch_size=500,
+        flush_interval=5.0,
+        shared=False,
+        busy_retries=10,
+        stats=None,
+        timings=None,
+        signals=None,
+    ):
+        self.db_name = db_name
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.shared = shared
+        self.busy_retries = busy_retries
+        self.stats = stats
+        self.timings = timings or StageTimings()
+        self.signals = signals
+        self.queue = None
+        self.writer = None
+        # Set by the writer thread once the database is open (or failed to)
+        self.started = threading.Event()
+        self.error = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        pipeline = cls(
+            db_name=settings.get("DB_NAME", "playstore_data.db"),
+            queue_size=settings.getint("DB_WRITER_QUEUE_SIZE", 1000),
+            batch_size=settings.getint("DB_BATCH_SIZE", 500),
+            flush_interval=settings.getfloat("DB_FLUSH_INTERVAL", 5.0),
+            shared=bool(settings.get("WORK_QUEUE_DB")),
+            busy_retries=settings.getint("DB_BUSY_RETRIES", 10),
+            stats=crawler.stats,
+            timings=StageTimings.from_crawler(crawler),
+            signals=crawler.signals,
+        )
+        crawler.db_writer = pipeline
+        return pipeline
+
+    def open_spider(self, spider):
+        self.queue = queue.Queue(maxsize=self.queue_size)
+        self.writer = threading.Thread(
+            target=self.write_loop, name="db-writer", daemon=True
+        )
+        self.writer.start()
+
+        def started():
+            self.started.wait()
+            if self.error is not None:
+                raise self.error
+
+        return threads.deferToThread(started)
+
     def process_item(self, item, spider):
+        if not isinstance(item, (AppItem, AppRankingsItem, AppReviewsItem)):
+            return item
+
+        try:
+            self.queue.put_nowait(item)
+        except queue.Full:
+            # Backpressure: wait for the writer to catch up off the reactor
+            self.stats.inc_value("db_writer/queue_full")
+            d = threads.deferToThread(self.put, item)
+            d.addCallback(lambda _: item)
+            return d
+
+        self.stats.max_value("db_writer/queue_depth_max", self.queue.qsize())
         return item
+
+    def submit(self, item):
+        """Queue ``item`` from a thread other than the reactor's.
+
+        Blocks while the queue is full, which slows the calling browser thread
+        down to the speed of the writer.
+        """
+        self.put(item)
+        self.stats.max_value("db_writer/queue_depth_max", self.queue.qsize())
+
+    def put(self, item):
+        """Wait for room in the queue, as long as the writer is running."""
+        while True:
+            if not self.writer.is_alive():
+                raise WriterStopped(f"Database writer stopped: {self.error}")
+            try:
+                self.queue.put(item, timeout=1)
+                return
+            except queue.Full:
+                continue
+
+    def close_spider(self, spider):
+        def stop():
+            if self.writer.is_alive():
+                self.put(STOP)
+                self.writer.join()
+
+        return threads.deferToThread(stop)
+
+    def write_loop(self):
+        """Store queued items until STOP is received. Runs on the writer thread."""
+        try:
+            db_manager = DatabaseManager(
+                self.db_name,
+                batch_size=self.batch_size,
+                flush_interval=self.flush_interval,
+            )
+        except Exception as e:
+            logger.error(f"Could not open the database {self.db_name}: {e}")
+            self.error = e
+            self.started.set()
+            return
+
+        self.started.set()
+        # Items written since the last commit
+        uncommitted = []
+        try:
+            while True:
+                try:
+                    item = self.queue.get(timeout=self.flush_interval)
+                except queue.Empty:
+                    # Nothing arrived for a while: commit what we have
+                    with self.timings.time("db_flush"):
+                        db_manager.flush()
+                    uncommitted = self.stored(uncommitted)
+                    continue
+
+                if item is STOP:
+                    break
+
+                start = time.monotonic()
+                try:
+                    self.store(db_manager, item)
+                except Exception as e:
+                    logger.error(f"Could not store item: {e}")
+                    self.stats.inc_value("db_writer/errors")
+                    self.send(item_store_failed, item=item, error=e)
+                    continue
+
+                uncommitted.append(item)
+                # No pending rows left means the write ended with a commit
+                if db_manager.pending_rows == 0:
+                    uncommitted = self.stored(uncommitted)
+
+                elapsed = time.monotonic() - start
+                self.timings.record("db_write", elapsed)
+                elapsed_ms = int(elapsed * 1000)
+                self.stats.inc_value("db_writer/items")
+                self.stats.inc_value("db_writer/write_time_ms", elapsed_ms)
+                self.stats.max_value("db_writer/write_max_ms", elapsed_ms)
+                self.stats.set_value("db_writer/queue_depth", self.queue.qsize())
+
+            db_manager.flush()
+            self.stored(uncommitted)
+        except Exception as e:
+            logger.error(f"Database writer stopped: {e}")
+            self.error = e
+            raise
+        finally:
+            db_manager.close()
+
+    def stored(self, items):
+        """Announce committed ``items`` and return a new, empty list."""
+        if items:
+            self.send(items_stored, items=items)
+        return []
+
+    def send(self, signal, **kwargs):
+        """Send ``signal`` on the reactor thread. Called from the writer thread."""
+        if self.signals is None:
+            return
+
+        from twisted.internet import reactor
+
+        reactor.callFromThread(self.signals.send_catch_log, signal=signal, **kwargs)
+
+    def store(self, db_manager, item):
+        """Write ``item``, committing it right away in a shared crawl."""
+        if not self.shared:
+            self.write_item(db_manager, item)
+            return
+
+        for attempt in range(self.busy_retries + 1):
+            try:
+                self.write_item(db_manager, item)
+                db_manager.flush()
+                return
+            except sqlite3.OperationalError as e:
+                if "locked" not in str(e) or attempt == self.busy_retries:
+                    raise
+                # Earlier items are committed, so only this one is undone
+                db_manager.rollback()
+                self.stats.inc_value("db_writer/busy_retries")
+                time.sleep(min(30, 2**attempt))
+
+    def write_item(self, db_manager, item):
+        adapter = ItemAdapter(item)
+        if isinstance(item, AppItem):
+            db_manager.insert_app_data(adapter)
+            return
+        if isinstance(item, AppRankingsItem):
+            db_manager.insert_rankings(
+                adapter["category"], adapter["crawled_at"], adapter["rankings"]
+            )
+            return
+
+        # Apps are keyed by package id; rows stored before that only have a title
+        app_id = (
+            adapter.get("app_id")
+            or db_manager.get_app_id_by_package(adapter.get("package_id"))
+            or db_manager.get_app_id(adapter.get("title"))
+        )
+        if app_id is None:
+            logger.info(
+                f"Skipping reviews of {adapter.get('title')}, not found in the apps table."
+            )
+            self.stats.inc_value("db_writer/reviews_unknown_app")
+            return
+        inserted = db_manager.insert_review_data(app_id, adapter["reviews"])
+        self.stats.inc_value("db_writer/reviews_new", inserted)
+        self.stats.inc_value(
+            "db_writer/reviews_duplicate", len(adapter["reviews"]) - inserted
+        )
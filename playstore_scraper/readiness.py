@@ -0,0 +1,178 @@
+"""
+Event-driven page readiness checks.
+
+Page actions wait on a concrete DOM condition instead of sleeping for a fixed
+number of seconds. Each named condition has its own timeout
+(READINESS_TIMEOUTS). If a condition does not appear in time, the action sleeps
+for READINESS_FALLBACK_DELAY seconds and then carries on. The time spent in
+every wait goes to the crawl stats under ``readiness/<condition>/...``, and to
+the ``wait_<condition>`` stage of the crawl's StageTimings.
+
+Selenium's webdriver package is only imported once a condition is used, so
+loading the spiders does not pay for it.
+"""
+
+import logging
+import threading
+import time
+
+from selenium.common.exceptions import StaleElementReferenceException
+from selenium.common.exceptions import TimeoutException
+
+from scrapy import signals
+
+from playstore_scraper.timing import StageTimings
+
+logger = logging.getLogger(__name__)
+
+APP_TITLE_XPATH = "//h1/span[contains(@itemprop,'name')]"
+RANKING_APPS_XPATH = (
+    "//section[contains(@jscontroller,'IgeFAf')]//div[contains(@jscontroller,'tKHFxf')]/a"
+)
+REVIEW_TEXT_XPATH = "//div[@role='dialog']//div[@class='h3YV2d']"
+
+COUNT_SCRIPT = """
+return document.evaluate(
+    "count(" + arguments[0] + ")", document, null, XPathResult.NUMBER_TYPE, null
+).numberValue;
+"""
+
+
+def ranking_section_rendered(previous=None):
+    """Ready once the ranking section lists apps and ``previous`` has gone stale.
+
+    ``previous`` is an app link captured before a ranking tab was clicked. Pass
+    None when the clicked tab is already showing.
+    """
+    from selenium.webdriver.common.by import By
+
+    def condition(driver):
+        if previous is not None:
+            try:
+                previous.is_enabled()
+                return False
+            except StaleElementReferenceException:
+                pass
+        return driver.find_elements(By.XPATH, RANKING_APPS_XPATH) or False
+
+    return condition
+
+
+def more_reviews_loaded(previous_count):
+    """Ready once the reviews dialog lists more than ``previous_count`` reviews."""
+
+    def condition(driver):
+        return driver.execute_script(COUNT_SCRIPT, REVIEW_TEXT_XPATH) > previous_count
+
+    return condition
+
+
+def expected(name, by, value):
+    """Return a factory for the expected_conditions check ``name``.
+
+    ``by`` is the name of a ``By`` locator strategy, such as "XPATH".
+    """
+
+    def factory():
+        from selenium.webdriver.common.by import By
+        from selenium.webdriver.support import expected_conditions as EC
+
+        return getattr(EC, name)((getattr(By, by), value))
+
+    return factory
+
+
+CONDITIONS = {
+    # App detail page: the title heading has been rendered
+    "app_title": expected("presence_of_element_located", "XPATH", APP_TITLE_XPATH),
+    # "About this app" dialog opened by the arrow button
+    "details_dialog": expected(
+        "visibility_of_element_located",
+        "XPATH",
+        "//div[@role='dialog']//div[contains(text(), 'Version')]",
+    ),
+    # Category page: the ranking tab buttons are available
+    "category_page": expected(
+        "presence_of_element_located", "ID", "ct|apps_topselling_free"
+    ),
+    # Category page: the ranking section was re-rendered after a tab click
+    "ranking_section": ranking_section_rendered,
+    # "See all reviews" dialog lists at least one review
+    "reviews_dialog": expected(
+        "presence_of_element_located", "XPATH", REVIEW_TEXT_XPATH
+    ),
+    # Reviews dialog: scrolling to the end loaded another page of reviews
+    "more_reviews": more_reviews_loaded,
+}
+
+
+class PageReadiness:
+    """Wait on named DOM conditions and record how long each wait took."""
+
+    def __init__(
+        self,
+        timeouts=None,
+        default_timeout=10,
+        fallback_delay=0,
+        stats=None,
+        timings=None,
+    ):
+        self.timeouts = timeouts or {}
+        self.default_timeout = default_timeout
+        self.fallback_delay = fallback_delay
+        self.stats = stats
+        self.timings = timings
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        readiness = cls(
+            timeouts=settings.getdict("READINESS_TIMEOUTS"),
+            default_timeout=settings.getfloat("READINESS_DEFAULT_TIMEOUT", 10),
+            fallback_delay=settings.getfloat("READINESS_FALLBACK_DELAY", 0),
+            timings=StageTimings.from_crawler(crawler),
+        )
+        # Spiders build this before the crawler has its stats collector
+        crawler.signals.connect(readiness.spider_opened, signal=signals.spider_opened)
+        return readiness
+
+    def spider_opened(self, spider):
+        if self.stats is None:
+            self.stats = spider.crawler.stats
+
+    def wait(self, driver, name, *args):
+        """Block until condition ``name`` holds. Return False on timeout."""
+        from selenium.webdriver.support.ui import WebDriverWait
+
+        condition = CONDITIONS[name](*args)
+        timeout = float(self.timeouts.get(name, self.default_timeout))
+
+        start = time.monotonic()
+        try:
+            WebDriverWait(driver, timeout, poll_frequency=0.1).until(condition)
+            ready = True
+        except TimeoutException:
+            ready = False
+            logger.warning(f"Page not ready after {timeout}s waiting for {name}")
+            if self.fallback_delay:
+                time.sleep(self.fallback_delay)
+
+        self.record(name, time.monotonic() - start, ready)
+        return ready
+
+    def record(self, name, elapsed, ready):
+        """Add one wait to the crawl stats."""
+        if self.timings is not None:
+            self.timings.record(f"wait_{name}", elapsed)
+        if self.stats is None:
+            return
+
+        elapsed_ms = int(elapsed * 1000)
+        prefix = f"readiness/{name}"
+        with self._lock:
+            self.stats.inc_value(f"{prefix}/count")
+            self.stats.inc_value(f"{prefix}/time_ms", elapsed_ms)
+            self.stats.max_value(f"{prefix}/max_ms", elapsed_ms)
+            if not ready:
+                self.stats.inc_value(f"{prefix}/timeouts")
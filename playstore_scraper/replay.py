@@ -0,0 +1,68 @@
+"""
+Recorded crawl storage for offline, deterministic runs.
+
+A recording is a directory with two parts:
+
+- ``objects/``: gzip-compressed response bodies, stored under the SHA-256 of
+  their content. A page that is fetched many times is stored once.
+- ``index/``: one JSON entry per request. It holds the status, headers and URL
+  of the response, the hash of its body, and, for requests rendered by the
+  Selenium middleware, the value returned by the page action.
+
+ReplayMiddleware in middlewares.py writes recordings and serves them back.
+"""
+
+import gzip
+import hashlib
+import json
+import os
+
+
+class ReplayStore:
+    """Read and write a recorded crawl under ``root``."""
+
+    def __init__(self, root):
+        self.root = root
+        self.objects_dir = os.path.join(root, "objects")
+        self.index_dir = os.path.join(root, "index")
+        os.makedirs(self.objects_dir, exist_ok=True)
+        os.makedirs(self.index_dir, exist_ok=True)
+
+    def object_path(self, digest):
+        return os.path.join(self.objects_dir, digest[:2], f"{digest}.gz")
+
+    def index_path(self, key):
+        return os.path.join(self.index_dir, f"{key}.json")
+
+    def put_body(self, body):
+        """Store a response body and return its content hash."""
+        digest = hashlib.sha256(body).hexdigest()
+        path = self.object_path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            self.write_atomic(path, gzip.compress(body))
+        return digest
+
+    def get_body(self, digest):
+        with open(self.object_path(digest), "rb") as f:
+            return gzip.decompress(f.read())
+
+    def save(self, key, entry, body):
+        """Record the response for ``key``."""
+        entry = dict(entry, body=self.put_body(body))
+        self.write_atomic(self.index_path(key), json.dumps(entry).encode("utf-8"))
+
+    def load(self, key):
+        """Return ``(entry, body)`` recorded for ``key``, or None."""
+        try:
+            with open(self.index_path(key), encoding="utf-8") as f:
+                entry = json.load(f)
+        except FileNotFoundError:
+            return None
+        return entry, self.get_body(entry["body"])
+
+    def write_atomic(self, path, data):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
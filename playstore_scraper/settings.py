@@ -50,21 +50,170 @@ ROBOTSTXT_OBEY = False
 
 # Enable or disable downloader middlewares
 # See https://docs.scrapy.org/en/latest/topics/downloader-middleware.html
-#DOWNLOADER_MIDDLEWARES = {
-#    "playstore_scraper.middlewares.PlaystoreScraperDownloaderMiddleware": 543,
-#}
+DOWNLOADER_MIDDLEWARES = {
+    "playstore_scraper.middlewares.ReplayMiddleware": 500,
+    "playstore_scraper.middlewares.BlockDetectionMiddleware": 540,
+    "playstore_scraper.middlewares.PlaystoreScraperDownloaderMiddleware": 543,
+}
+
+# Number of Chrome instances used to render requests flagged with
+# meta["selenium"]. Each browser runs on its own thread.
+SELENIUM_POOL_SIZE = 4
+
+# How the browsers are started (see browser.BrowserProfile). Requests for the
+# BROWSER_BLOCK_RESOURCES types ("image", "font", "media", "stylesheet") and
+# for URLs matching BROWSER_BLOCK_URL_PATTERNS ("*" wildcards) are blocked;
+# set either to [] to load them. The "eager" page load strategy returns from
+# driver.get once the DOM is parsed, "normal" waits for every subresource.
+BROWSER_HEADLESS = True
+BROWSER_PAGE_LOAD_STRATEGY = "eager"
+BROWSER_WINDOW_SIZE = "1920,1080"
+BROWSER_BLOCK_RESOURCES = ["image", "font", "media"]
+BROWSER_BLOCK_URL_PATTERNS = [
+    "*google-analytics.com*",
+    "*googletagmanager.com*",
+    "*doubleclick.net*",
+    "*googlesyndication.com*",
+    "*googleadservices.com*",
+    "*play.google.com/log*",
+]
+
+# Each browser is replaced after BROWSER_MAX_PAGES pages, or once its Chrome
+# processes use more than BROWSER_MAX_RSS_MB (summed RSS, Linux only), so long
+# crawls keep a steady memory footprint. 0 disables either limit. A browser
+# that crashes, or takes more than BROWSER_PAGE_LOAD_TIMEOUT seconds to load a
+# page, is replaced and the page is rendered again, up to BROWSER_MAX_RETRIES
+# times.
+BROWSER_MAX_PAGES = 200
+BROWSER_MAX_RSS_MB = 1500
+BROWSER_PAGE_LOAD_TIMEOUT = 30
+BROWSER_MAX_RETRIES = 2
+
+# Browsers start when the first page needs rendering. BROWSER_WARMUP of them
+# are started in the background as soon as the crawl opens instead, so they
+# are ready by the time the first category or app page needs one. Set it to
+# 0 for crawls that may not render anything (static fast path, replays).
+BROWSER_WARMUP = 1
+
+# Adapt how many browsers load pages at once, and how far apart page loads
+# start, to how the store responds (see throttle.py). Concurrency starts at
+# RENDER_THROTTLE_START_CONCURRENCY and grows by one browser per healthy
+# window of RENDER_THROTTLE_WINDOW pages, up to RENDER_THROTTLE_MAX_CONCURRENCY
+# (None for SELENIUM_POOL_SIZE). Windows averaging a driver.get time above
+# RENDER_THROTTLE_TARGET_LATENCY seconds, or with more than
+# RENDER_THROTTLE_MAX_ERROR_RATE failed renders, shrink it again and space
+# page loads out, between RENDER_THROTTLE_MIN_DELAY and
+# RENDER_THROTTLE_MAX_DELAY seconds. A blocked page halves it at once.
+RENDER_THROTTLE_ENABLED = True
+RENDER_THROTTLE_TARGET_LATENCY = 8.0
+RENDER_THROTTLE_START_CONCURRENCY = 1
+RENDER_THROTTLE_MIN_CONCURRENCY = 1
+RENDER_THROTTLE_MAX_CONCURRENCY = None
+RENDER_THROTTLE_MIN_DELAY = 0.0
+RENDER_THROTTLE_MAX_DELAY = 30.0
+RENDER_THROTTLE_MAX_ERROR_RATE = 0.2
+RENDER_THROTTLE_WINDOW = 10
+
+# Recognise CAPTCHA, consent, rate-limit and empty pages (see blocks.py). A
+# blocked request is retried after BLOCK_RETRY_DELAY seconds, doubling on
+# each further block up to BLOCK_MAX_RETRY_DELAY, and dropped after
+# BLOCK_MAX_RETRIES blocks. The browser that was blocked rests for
+# BLOCK_BROWSER_COOLDOWN seconds. Each block type is counted under blocks/*.
+BLOCK_DETECTION_ENABLED = True
+BLOCK_RETRY_DELAY = 30
+BLOCK_MAX_RETRY_DELAY = 600
+BLOCK_MAX_RETRIES = 5
+BLOCK_BROWSER_COOLDOWN = 60
+
+# Seconds to wait for each page readiness condition (see readiness.py) before
+# falling back to a fixed READINESS_FALLBACK_DELAY sleep
+READINESS_TIMEOUTS = {
+    "app_title": 10,
+    "details_dialog": 5,
+    "category_page": 10,
+    "ranking_section": 8,
+    "reviews_dialog": 8,
+    "more_reviews": 3,
+}
+READINESS_DEFAULT_TIMEOUT = 10
+READINESS_FALLBACK_DELAY = 1
+
+# Read app pages from the plain HTTP response and only render them in a
+# browser when one of STATIC_REQUIRED_FIELDS could not be read from it
+STATIC_FAST_PATH = True
+STATIC_REQUIRED_FIELDS = ["title", "version", "downloads", "updated_on", "price"]
+
+# Skip re-scraping apps whose "Updated on" date and version have not changed
+# since they were stored. Unchanged apps only get their rating, review and
+# download counts refreshed from the static page, until their last full scrape
+# is older than INCREMENTAL_TTL_DAYS.
+INCREMENTAL_CRAWL = False
+INCREMENTAL_TTL_DAYS = 7
+
+# The scrapers spider records the categories it has walked, the app pages found
+# under each ranking and the apps stored in FRONTIER_DB (None for
+# playstore_frontier.db next to DB_NAME). Progress is committed every
+# FRONTIER_CHECKPOINT_INTERVAL seconds. A crawl that did not finish resumes
+# from there on the next start instead of walking every category again.
+FRONTIER_ENABLED = True
+FRONTIER_DB = None
+FRONTIER_CHECKPOINT_INTERVAL = 30
+
+# Split one scrapers crawl over several worker processes by pointing them all
+# at the same WORK_QUEUE_DB (and DB_NAME). Each worker, named WORKER_ID
+# (default host:pid), leases WORK_QUEUE_LEASE_BATCH category or app pages at a
+# time. A lease not renewed within WORK_QUEUE_VISIBILITY_TIMEOUT seconds goes
+# back to the queue, and a page is given up after WORK_QUEUE_MAX_ATTEMPTS
+# tries. Replaces the frontier when set.
+WORK_QUEUE_DB = None
+WORKER_ID = None
+WORK_QUEUE_LEASE_BATCH = 8
+WORK_QUEUE_VISIBILITY_TIMEOUT = 300
+WORK_QUEUE_MAX_ATTEMPTS = 3
+
+# reviews_scraper scrolls the "See all reviews" dialog until it has read
+# REVIEWS_MAX_PER_APP reviews (0 for no limit) or no more reviews load. Reviews
+# older than REVIEWS_DATE_CUTOFF ("YYYY-MM-DD", None to keep all) are skipped,
+# and a loaded page holding only such reviews ends the app. Reviews are sent to
+# the database writer in chunks of REVIEWS_CHUNK_SIZE. Reviews already stored
+# are skipped, and with REVIEWS_STOP_AT_STORED a loaded page holding only
+# stored reviews ends the app as well.
+REVIEWS_MAX_PER_APP = 1000
+REVIEWS_DATE_CUTOFF = None
+REVIEWS_CHUNK_SIZE = 100
+REVIEWS_STOP_AT_STORED = True
 
 # Enable or disable extensions
 # See https://docs.scrapy.org/en/latest/topics/extensions.html
-#EXTENSIONS = {
-#    "scrapy.extensions.telnet.TelnetConsole": None,
-#}
+EXTENSIONS = {
+    "playstore_scraper.timing.StageTimings": 500,
+}
+
+# Per-stage timings (driver.get, waits, extraction, preprocessing, DB writes)
+# are in the crawl stats under timing/*. Set TIMING_EXPORT_PATH to also write
+# them to a file every TIMING_EXPORT_INTERVAL seconds and when the spider
+# closes. TIMING_EXPORT_FORMAT is "json" or "prometheus" (text format); when
+# unset, paths ending in ".json" get JSON and any other path Prometheus.
+TIMING_EXPORT_PATH = None
+TIMING_EXPORT_FORMAT = None
+TIMING_EXPORT_INTERVAL = 60
 
 # Configure item pipelines
 # See https://docs.scrapy.org/en/latest/topics/item-pipeline.html
-#ITEM_PIPELINES = {
-#    "playstore_scraper.pipelines.PlaystoreScraperPipeline": 300,
-#}
+ITEM_PIPELINES = {
+    "playstore_scraper.pipelines.PlaystoreScraperPipeline": 300,
+}
+
+# SQLite database written by PlaystoreScraperPipeline. Items wait in a queue of
+# DB_WRITER_QUEUE_SIZE for the writer thread, which commits every DB_BATCH_SIZE
+# rows or DB_FLUSH_INTERVAL seconds. Workers sharing a WORK_QUEUE_DB commit
+# every item instead, and try an item again up to DB_BUSY_RETRIES times while
+# another worker holds the database lock.
+DB_NAME = "playstore_data.db"
+DB_WRITER_QUEUE_SIZE = 1000
+DB_BATCH_SIZE = 500
+DB_FLUSH_INTERVAL = 5.0
+DB_BUSY_RETRIES = 10
 
 # Enable and configure the AutoThrottle extension (disabled by default)
 # See https://docs.scrapy.org/en/latest/topics/autothrottle.html
@@ -79,6 +228,12 @@ ROBOTSTXT_OBEY = False
 # Enable showing throttling stats for every response received:
 #AUTOTHROTTLE_DEBUG = False
 
+# Record every response (including rendered pages) to REPLAY_DIR with
+# REPLAY_MODE = "record", or crawl offline from a recording with
+# REPLAY_MODE = "replay". Disabled when unset.
+REPLAY_MODE = None
+REPLAY_DIR = "replay"
+
 # Enable and configure HTTP caching (disabled by default)
 # See https://docs.scrapy.org/en/latest/topics/downloader-middleware.html#httpcache-middleware-settings
 #HTTPCACHE_ENABLED = True
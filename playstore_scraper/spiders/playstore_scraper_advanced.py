@@ -20,24 +20,54 @@ It extracts data such as:
 How it works:
 1. Reads category names and URLs from a CSV file.
 2. Visits each category page and navigates through different ranking sections
-   (Top Free, Top Grossing, Top Paid).
-3. Clicks on app links to visit individual app pages and extract details.
-4. Saves extracted data into an SQLite database using the DatabaseManager.
+   (Top Free, Top Grossing, Top Paid). Every listing is stored as an
+   AppRankingsItem, but an app listed several times is only scraped once.
+3. Visits individual app pages and extracts details. Fields are read from the
+   plain HTTP response first; the page is only rendered in a browser when some
+   of STATIC_REQUIRED_FIELDS are missing.
+   Pages are rendered by PlaystoreScraperDownloaderMiddleware, which spreads
+   them over a pool of browsers (SELENIUM_POOL_SIZE).
+   With INCREMENTAL_CRAWL, apps whose "Updated on" date and version match the
+   stored row are not rendered again until INCREMENTAL_TTL_DAYS have passed.
+   With FRONTIER_ENABLED, the categories walked and the apps found and stored
+   are recorded in a CrawlFrontier, and an interrupted crawl resumes from it.
+   With WORK_QUEUE_DB, category and app pages are leased from a WorkQueue
+   shared with other worker processes instead, so several workers can split
+   one crawl.
+4. Yields the extracted data as AppItems, which PlaystoreScraperPipeline saves
+   into an SQLite database using the DatabaseManager.
 
 """
 
 import scrapy
+from scrapy import signals
+from scrapy.exceptions import DontCloseSpider
 import os
 import csv
-import time
 import re
 import logging
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.chrome.options import Options
+import sqlite3
+from datetime import datetime, timedelta, timezone
+from playstore_scraper.blocks import RetryLater
 from playstore_scraper.database import DatabaseManager
+from playstore_scraper.items import AppItem, AppRankingsItem
+from playstore_scraper.normalize import (
+    clean_text,
+    parse_count,
+    parse_date,
+    parse_flag,
+    parse_rating,
+)
+from playstore_scraper.extractors import (
+    extract_app_details,
+    extract_records,
+    package_id_from_url,
+    parse_app_response,
+)
+from playstore_scraper.frontier import CrawlFrontier
+from playstore_scraper.readiness import PageReadiness, RANKING_APPS_XPATH
+from playstore_scraper.timing import StageTimings
+from playstore_scraper.workqueue import CATEGORY, WorkQueue
 from selenium.common.exceptions import StaleElementReferenceException
 
 
@@ -48,26 +78,97 @@ class PlaystoreSpider(scrapy.Spider):
     def __init__(self):
         # Read category data from CSV file
         self.categories = self.read_categories_from_csv("../output/categories.csv")
-        self.category_counters = {}
-        # Set up Selenium WebDriver
-        chrome_options = Options()
-        chrome_options.add_argument("--disable-gpu")
-        chrome_options.add_argument("--no-sandbox")
-        self.driver = webdriver.Chrome(options=chrome_options)
 
-        # Initialize database manager and create table if not exists
-        self.db_manager = DatabaseManager()
-        self.db_manager.create_apps_table()
+        # Package ids of the apps requested in this run
+        self.requested_apps = set()
+
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        spider = super().from_crawler(crawler, *args, **kwargs)
+        spider.readiness = PageReadiness.from_crawler(crawler)
+        spider.timings = StageTimings.from_crawler(crawler)
+
+        # Incremental crawls compare pages against what is already stored.
+        # The database is opened by the first app page that needs it.
+        spider.incremental = crawler.settings.getbool("INCREMENTAL_CRAWL")
+        spider.db_manager = None
+
+        # The shared queue keeps its own record of the crawl, so the frontier
+        # is only used by a crawl run by a single process
+        spider.work_queue = spider.frontier = None
+        if crawler.settings.get("WORK_QUEUE_DB"):
+            spider.work_queue = WorkQueue.from_crawler(crawler)
+            crawler.signals.connect(spider.lease_more, signal=signals.spider_idle)
+        elif crawler.settings.getbool("FRONTIER_ENABLED"):
+            spider.frontier = CrawlFrontier.from_crawler(crawler)
+            if spider.frontier.resuming:
+                spider.requested_apps.update(spider.frontier.known_apps())
+        return spider
 
     def start_requests(self):
-        # Start scraping each category URL
+        if self.work_queue is not None:
+            # Every worker queues the categories (the queue ignores those
+            # already there) and then only requests the tasks it leased
+            self.work_queue.add_categories(self.categories)
+            yield from self.leased_requests()
+            return
+
+        # Start scraping each category URL. Categories walked by an unfinished
+        # earlier crawl are skipped, and their apps not stored yet are
+        # requested directly instead.
         for item in self.categories:
-            self.category_counters[item["category"]] = 0
-            yield scrapy.Request(
-                url=item["url"],
-                callback=self.parse_category_page,
-                meta={"category": item["category"]},
+            if self.frontier is not None and self.frontier.category_walked(
+                item["category"]
+            ):
+                self.crawler.stats.inc_value("frontier/categories_skipped")
+                continue
+            yield self.category_request(item["url"], item["category"])
+
+        if self.frontier is not None and self.frontier.resuming:
+            for url, category, ranking_category in self.frontier.pending_apps():
+                self.crawler.stats.inc_value("frontier/apps_resumed")
+                yield self.app_request(url, category, ranking_category)
+
+    def leased_requests(self):
+        """Lease tasks from the work queue and return their requests."""
+        requests = []
+        for task in self.work_queue.lease():
+            if task["kind"] == CATEGORY:
+                request = self.category_request(task["url"], task["category"])
+            else:
+                request = self.app_request(
+                    task["url"], task["category"], task["ranking_category"]
+                )
+            # Another worker, or an earlier lease of ours, may have requested
+            # the same page already
+            requests.append(
+                request.replace(
+                    dont_filter=True,
+                    errback=self.task_failed,
+                    meta=dict(request.meta, task_id=task["task_id"]),
+                )
             )
+        return requests
+
+    def lease_more(self, spider):
+        """Keep the worker open and leasing until the shared queue is drained."""
+        if spider is not self:
+            return
+        requests = self.leased_requests()
+        for request in requests:
+            self.crawler.engine.crawl(request)
+        if requests or not self.work_queue.drained():
+            # Tasks still leased by other workers may come back when their
+            # lease expires
+            raise DontCloseSpider
+
+    def task_failed(self, failure):
+        """Give the task of a request that could not be downloaded back."""
+        if failure.check(RetryLater):
+            # Blocked: the same request is scheduled again after a delay
+            return
+        self.logger.error(f"Task failed: {failure.request.url}: {failure.value}")
+        self.work_queue.fail(failure.request.meta["task_id"], failure.value)
 
     def read_categories_from_csv(self, file_path):
         """Read categories and their URLs from a CSV file with error handling."""
@@ -111,9 +212,85 @@ class PlaystoreSpider(scrapy.Spider):
 
     def parse_category_page(self, response):
         category = response.meta["category"]
-        print(f"Attempting to load URL: {response.url}")
+        app_links = {
+            ranking_category: [response.urljoin(link) for link in links]
+            for ranking_category, links in response.meta["selenium_result"].items()
+        }
+
+        yield AppRankingsItem(
+            category=category,
+            crawled_at=datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            rankings=[
+                {
+                    "package_id": package_id_from_url(url),
+                    "ranking_category": ranking_category,
+                    "position": position,
+                }
+                for ranking_category, urls in app_links.items()
+                for position, url in enumerate(urls, start=1)
+            ],
+        )
+
+        if self.work_queue is not None:
+            # The apps are leased later, by whichever worker is free
+            self.work_queue.add_apps(category, app_links)
+            self.work_queue.complete(response.meta["task_id"])
+            return
+
+        if self.frontier is not None:
+            self.frontier.add_category(category, app_links)
+
+        # An app is scraped under the first tab and category it was seen in
+        for ranking_category, urls in app_links.items():
+            for url in urls:
+                package_id = package_id_from_url(url)
+                if package_id in self.requested_apps:
+                    self.crawler.stats.inc_value("rankings/repeated_listings")
+                    continue
+                self.requested_apps.add(package_id)
+                yield self.app_request(url, category, ranking_category)
+
+    def category_request(self, url, category):
+        """Return the request that collects the app links of a category page."""
+        return scrapy.Request(
+            url=url,
+            callback=self.parse_category_page,
+            meta={
+                "category": category,
+                "selenium": True,
+                "selenium_action": "collect_app_links",
+            },
+        )
+
+    def app_request(self, url, category, ranking_category):
+        """Return the request for an app page listed under a ranking category."""
+        # With the static fast path or an incremental crawl, app pages are
+        # first fetched as plain HTTP responses and only rendered when needed
+        render = not (
+            self.settings.getbool("STATIC_FAST_PATH")
+            or self.settings.getbool("INCREMENTAL_CRAWL")
+        )
+        return scrapy.Request(
+            url=url,
+            callback=self.parse_app_page,
+            meta={
+                "category": category,
+                "ranking_category": ranking_category,
+                "selenium": render,
+                "selenium_action": "extract_app_page",
+            },
+        )
+
+    def collect_app_links(self, driver, request):
+        """Click through the ranking tabs of a category page and collect app links.
+
+        Runs on a browser thread of the downloader middleware. Returns a dict
+        mapping each ranking category to the app URLs listed under it.
+        """
+        from selenium.webdriver.common.by import By
 
-        self.driver.get(response.url)
+        print(f"Attempting to load URL: {request.url}")
+        self.readiness.wait(driver, "category_page")
 
         category_buttons = {
             "Top Free": "ct|apps_topselling_free",
@@ -121,87 +298,165 @@ class PlaystoreSpider(scrapy.Spider):
             "Top Paid": "ct|apps_topselling_paid",
         }
 
-        found_ranking_apps = False  # Flag to check if we found ranking category apps
+        app_links = {}
 
         for ranking_category, button_id in category_buttons.items():
             try:
                 attempts = 3
                 for _ in range(attempts):
                     try:
-                        button = self.driver.find_element(By.ID, button_id)
-                        self.driver.execute_script(
+                        # Remember the first app shown so we can tell when the
+                        # section has been re-rendered for the clicked tab.
+                        # Top Free is already showing when the page loads.
+                        previous = None
+                        if ranking_category != "Top Free":
+                            shown_apps = driver.find_elements(
+                                By.XPATH, RANKING_APPS_XPATH
+                            )
+                            previous = shown_apps[0] if shown_apps else None
+
+                        button = driver.find_element(By.ID, button_id)
+                        driver.execute_script(
                             "arguments[0].scrollIntoView({behavior: 'smooth', block: 'center'});",
                             button,
                         )
-                        self.driver.execute_script("arguments[0].click();", button)
-                        time.sleep(6)
+                        driver.execute_script("arguments[0].click();", button)
+                        self.readiness.wait(driver, "ranking_section", previous)
                         break
                     except StaleElementReferenceException:
                         print("Element became stale, retrying...")
-                        time.sleep(2)
+                        self.readiness.wait(driver, "category_page")
             except Exception as e:
                 self.logger.error(f"Could not click {ranking_category}: {e}")
                 continue  # Move to the next category if this one fails
 
             # Extract apps from the ranking category
-            app_elements = self.driver.find_elements(
-                By.XPATH,
-                "//section[contains(@jscontroller,'IgeFAf')]//div[contains(@jscontroller,'tKHFxf')]/a",
-            )
-
-            if app_elements:  # If apps found, set flag to True
-                found_ranking_apps = True
-
-            for app_element in app_elements:
-                app_link = app_element.get_attribute("href")
-                yield scrapy.Request(
-                    url=app_link,
-                    callback=self.parse_app_page,
-                    meta={
-                        "category": category,
-                        "ranking_category": ranking_category,
-                        "category_url": response.url,
-                    },
+            with self.timings.time("extract"):
+                app_elements = extract_records(
+                    driver, RANKING_APPS_XPATH, {"link": "./@href"}
                 )
 
+            if app_elements:
+                app_links[ranking_category] = [app["link"] for app in app_elements]
+
         # If no ranking category apps were found, then move to additional apps
-        if not found_ranking_apps:
-            additional_apps = self.driver.find_elements(
-                By.XPATH,
+        if not app_links:
+            additional_apps = extract_records(
+                driver,
                 "//div[contains(@jscontroller,'jZ2Ncd')]//div[contains(@class,'ULeU3b neq64b')]//a",
+                {"link": "./@href"},
             )
+            app_links["No Rank"] = [app["link"] for app in additional_apps]
 
-            for app_element in additional_apps:
-                app_link = app_element.get_attribute("href")
-                yield scrapy.Request(
-                    url=app_link,
-                    callback=self.parse_app_page,
-                    meta={
-                        "category": category,
-                        "ranking_category": "No Rank",
-                        "category_url": response.url,
-                    },
-                )
+        return app_links
 
     def parse_app_page(self, response):
-        category = response.meta["category"]
-        ranking_category = response.meta["ranking_category"]
-        category_url = response.meta["category_url"]
+        page_data = {
+            "package_id": package_id_from_url(response.url),
+            "category": response.meta["category"],
+            "ranking_category": response.meta["ranking_category"],
+        }
+
+        if response.meta.get("selenium"):
+            # Rendered page: fill whatever the static parse could not read
+            raw_data = dict(response.meta["selenium_result"])
+            static_data = response.meta.get("static_data") or {}
+            raw_data.update({key: value for key, value in static_data.items() if value})
+        else:
+            with self.timings.time("static_parse"):
+                raw_data = parse_app_response(response)
+            raw_data.update(page_data)
+
+            if self.incremental:
+                refreshed = self.refresh_unchanged_app(raw_data)
+                if refreshed is not None:
+                    self.crawler.stats.inc_value("incremental/unchanged")
+                    yield refreshed
+                    return
+                self.crawler.stats.inc_value("incremental/changed")
+
+            missing = [
+                field
+                for field in self.settings.getlist("STATIC_REQUIRED_FIELDS")
+                if not raw_data.get(field)
+            ]
+            if missing or not self.settings.getbool("STATIC_FAST_PATH"):
+                self.logger.debug(
+                    f"Rendering {response.url}, missing from static page: {missing}"
+                )
+                yield response.request.replace(
+                    dont_filter=True,
+                    meta=dict(response.meta, selenium=True, static_data=raw_data),
+                )
+                return
+
+        raw_data.update(page_data)
+
+        with self.timings.time("preprocess"):
+            item = AppItem(self.preprocess_data(raw_data))
+
+        # Stored in the database by PlaystoreScraperPipeline
+        yield item
+
+    def refresh_unchanged_app(self, raw_data):
+        """Return an AppItem for an app that has not changed since it was stored.
+
+        An app counts as unchanged when its "Updated on" date (and version, if
+        the static page has one) match the stored row, and that row was fully
+        scraped less than INCREMENTAL_TTL_DAYS ago. Only the counters read
+        from the static page are refreshed. Returns None otherwise.
+        """
+        try:
+            if self.db_manager is None:
+                # Lookups only: the pipeline's writer owns the writing connection
+                self.db_manager = DatabaseManager(
+                    self.settings.get("DB_NAME"), read_only=True
+                )
+            stored = self.db_manager.get_app(raw_data["package_id"])
+        except sqlite3.OperationalError:
+            # No database or apps table yet: nothing is stored
+            return None
+        if stored is None or not stored["scraped_at"]:
+            return None
+
+        age = datetime.now(timezone.utc) - datetime.fromisoformat(stored["scraped_at"])
+        if age > timedelta(days=self.settings.getfloat("INCREMENTAL_TTL_DAYS")):
+            return None
+
+        fresh = self.preprocess_data(raw_data)
+        if fresh["updated_on"] is None or fresh["updated_on"] != stored["updated_on"]:
+            return None
+        if fresh["version"] and fresh["version"] != stored["version"]:
+            return None
+
+        item = AppItem(stored)
+        item.update(
+            {
+                key: fresh[key]
+                for key in ("rating", "review_count", "downloads")
+                if fresh[key] is not None
+            }
+        )
+        item["category"] = fresh["category"]
+        item["ranking_category"] = fresh["ranking_category"]
+        return item
 
-        if not self.driver:  # Restart WebDriver if it's closed
-            chrome_options = Options()
-            chrome_options.add_argument("--disable-gpu")
-            chrome_options.add_argument("--no-sandbox")
-            self.driver = webdriver.Chrome(options=chrome_options)
+    def extract_app_page(self, driver, request):
+        """Read the raw app details from a rendered app page.
 
-        print(f"Attempting to load URL: {response.url}")
+        Runs on a browser thread of the downloader middleware. The page is
+        loaded on its own, so nothing needs restoring afterwards.
+        """
+        from selenium.webdriver.common.by import By
+        from selenium.webdriver.support import expected_conditions as EC
+        from selenium.webdriver.support.ui import WebDriverWait
 
-        self.driver.get(response.url)
-        time.sleep(6)
+        print(f"Attempting to load URL: {request.url}")
+        self.readiness.wait(driver, "app_title")
 
         # Click the arrow button before extracting details
         try:
-            wait = WebDriverWait(self.driver, 10)
+            wait = WebDriverWait(driver, 10)
             buttons = wait.until(
                 EC.presence_of_all_elements_located(
                     (By.XPATH, "//div[contains(@jscontroller,'lpwuxb')]//button")
@@ -212,146 +467,51 @@ class PlaystoreSpider(scrapy.Spider):
             if buttons:
                 print("Trying to click the first button using Selenium's .click()")
                 buttons[0].click()
-                time.sleep(3)
+                self.readiness.wait(driver, "details_dialog")
             else:
                 print("Trying to scroll into view before clicking...")
-                self.driver.execute_script("arguments[0].scrollIntoView();", buttons[0])
+                driver.execute_script("arguments[0].scrollIntoView();", buttons[0])
                 buttons[0].click()
 
         except Exception as e:
             logging.warning(f"Arrow button click skipped or failed: {e}")
 
-        # Extract app price
-        price = self.extract_price()
-
-        # XPaths for extracting various app details
-        xpaths = {
-            # "title": "//h1/span",
-            "title": "//h1/span[contains(@itemprop,'name')]",
-            "rating": "//div[contains(@class,'TT9eCd') and contains(@aria-label, 'Rated')]",
-            "version": "//div[contains(text(), 'Version')]/following-sibling::div",
-            "review_count": "//div[contains(@class,'g1rdde') and contains(text(), 'reviews')]",
-            "downloads": "//div[contains(@class,'wVqUob')] [div[2][contains(text(),'Downloads')]] /div[1]",
-            "Requires_android": "//div[contains(text(), 'Requires Android')]/following-sibling::div",
-            "age_suitability": "//span[@itemprop='contentRating']",
-            "updated_on": "//div[contains(text(), 'Updated on')]/following-sibling::div",
-            "ads": "//span[contains(@class, 'UIuSk')]",
-            "In_app_purchases": "//div[@class='sMUprd'][div[1][contains(text(), 'In-app purchases')]]/div[2]",
-        }
-
-        extracted_data = {
-            key: self.driver.find_elements(By.XPATH, xpath)
-            for key, xpath in xpaths.items()
-        }
-
-        raw_data = {
-            key: extracted_data[key][0].text if extracted_data[key] else None
-            for key in xpaths
-        }
-
-        raw_data.update(
-            {
-                "category": category,
-                "ranking_category": ranking_category,
-                "price": price,
-            }
-        )
-
-        cleaned_data = self.preprocess_data(raw_data)
-
-        try:
-            # Insert app data into database
-            self.db_manager.insert_app_data(cleaned_data)
-            yield cleaned_data
-        finally:
-            # Return to category page
-            print(f"Attempting to load URL: {category_url}")
-
-            self.driver.get(category_url)
-            time.sleep(10)
-
-        return
+        # Read every field, including the price, in a single browser call
+        with self.timings.time("extract"):
+            return extract_app_details(driver)
 
     def preprocess_data(self, data):
-        def clean_numeric_value(value):
-            if not value or not isinstance(value, str):
-                return "Not Available"
-            try:
-                value = value.replace("+", "").strip()
-                if "K" in value:
-                    return int(float(value.replace("K", "")) * 1000)
-                elif "M" in value:
-                    return int(float(value.replace("M", "")) * 1000000)
-                elif "L" in value:  # Handling 'L' for Lakh (1 Lakh = 100,000)
-                    return int(float(value.replace("L", "")) * 100000)
-                elif "Cr" in value:  # Handling 'Cr' for Crore (1 Crore = 10,000,000)
-                    return int(float(value.replace("Cr", "")) * 10000000)
-                return int(value)
-            except ValueError:
-                return "Not Available"
+        """Convert raw page text to the typed values stored in the apps table.
 
+        Missing values become None.
+        """
         return {
+            "package_id": data["package_id"],
             "category": data["category"],
             "title": data["title"],
-            "rating": data["rating"].replace("\nstar", "")
-            if data["rating"]
-            else "No Rating",
-            "version": data["version"] if data["version"] else "Not Available",
-            "review_count": clean_numeric_value(
-                re.sub(r"[^\dKM]", "", data["review_count"])
-            )
-            if data["review_count"]
-            else None,
-            "downloads": clean_numeric_value(data["downloads"]),
-            "age_suitability": re.sub(r"[^0-9+]", "", data["age_suitability"])
-            if data["age_suitability"]
-            else None,
-            "updated_on": data["updated_on"] if data["updated_on"] else "Not Available",
-            "ads": data["ads"] if data["ads"] else "No Ad",
-            "requires_android": data["Requires_android"]
-            if data["Requires_android"]
-            else "Not Available",
-            "In_app_purchases": data["In_app_purchases"]
-            if data["In_app_purchases"]
-            else "No in-app-purchases",
-            "price": data["price"] if data["price"] else "Free",
+            "rating": parse_rating(data["rating"]),
+            "version": clean_text(data["version"]),
+            "review_count": parse_count(data["review_count"]),
+            "downloads": parse_count(data["downloads"]),
+            "age_suitability": clean_text(
+                re.sub(r"[^0-9+]", "", data["age_suitability"] or "")
+            ),
+            "updated_on": parse_date(data["updated_on"]),
+            # The ads line reads "Contains ads", "In-app purchases" or both
+            "ads": parse_flag(data["ads"] or "", "ads"),
+            "requires_android": clean_text(data["Requires_android"]),
+            "In_app_purchases": bool(
+                parse_flag(data["In_app_purchases"] or "")
+                or parse_flag(data["ads"] or "", "in-app purchases")
+            ),
+            "price": clean_text(data["price"]),
             "ranking_category": data["ranking_category"],
+            "scraped_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
         }
 
-    def extract_price(self):
-        """Extract price of the app."""
-
-        try:
-            install_button = self.driver.find_element(
-                By.XPATH, "//button[contains(@aria-label, 'Install')]"
-            )
-            if install_button:
-                return "Free"
-        except Exception:
-            try:
-                price_element = self.driver.find_element(
-                    By.XPATH, "//div[contains(@class,'u4ICaf')]//button"
-                )
-                price_text = price_element.get_attribute("aria-label").strip()
-
-                # Remove "Buy" if it's at the start or end
-                price_text = re.sub(r"^(Buy\s*|\s*Buy)$", "", price_text).strip()
-
-                return price_text
-            except Exception:
-                return "Not Available"
-
-        return "Not Available"
-
     def closed(self, reason):
-        """Close the Selenium WebDriver and database connection when the spider finishes."""
+        """Log why the spider finished and close the database connection."""
         self.logger.info(f"Spider closed due to: {reason}")
 
-        if hasattr(self, "driver") and self.driver:
-            if len(self.driver.window_handles) > 1:
-                self.driver.close()
-            else:
-                self.driver.quit()
-
-        if hasattr(self.db_manager, "close"):
+        if self.db_manager is not None:
             self.db_manager.close()
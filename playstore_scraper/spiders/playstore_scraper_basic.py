@@ -1,11 +1,21 @@
 import scrapy
-import time
 import csv
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.chrome.options import Options
-from playstore_scraper.database import DatabaseManager
-from datetime import datetime
+from datetime import datetime, timezone
+from playstore_scraper.items import AppItem
+from playstore_scraper.normalize import (
+    clean_text,
+    parse_count,
+    parse_date,
+    parse_flag,
+    parse_rating,
+)
+from playstore_scraper.extractors import (
+    extract_fields,
+    package_id_from_url,
+    parse_app_response,
+)
+from playstore_scraper.readiness import PageReadiness
+from playstore_scraper.timing import StageTimings
 from selenium.common.exceptions import NoSuchElementException
 
 
@@ -14,42 +24,61 @@ class PlaystoreSpider(scrapy.Spider):
     allowed_domains = ["play.google.com"]
     categories = {}
 
-    def __init__(self):
-        """Initialize Selenium WebDriver and DatabaseManager."""
-        chrome_options = Options()
-        # chrome_options.add_argument("--headless")
-        chrome_options.add_argument("--no-sandbox")
-        chrome_options.add_argument("--disable-dev-shm-usage")
-
-        self.driver = webdriver.Chrome(options=chrome_options)
-        self.db_manager = DatabaseManager()
-        self.db_manager.create_apps_table()
+    # XPaths of the fields read from an app page
+    detail_xpaths = {
+        "title": "//h1/span",
+        "rating": "//div[@class='ClM7O']//div",
+        "version": "(//div[@class='reAt0'])[1] | //div[contains(@class, 'q078ud') and contains(text(), 'Version')]/following-sibling::div[@class='reAt0']",
+        "review_count": "//div[contains(@class,'g1rdde')][1]",
+        "downloads": "//div[contains(@class,'wVqUob')][2]/div",
+        "age_suitability": "//span[@itemprop='contentRating']",
+        "updated_on": "//div[contains(@class, 'xg1aie')]",
+        "ads": "//span[contains(@class, 'UIuSk')]",
+    }
+    detail_labels = {
+        "title": "Title",
+        "rating": "Rating",
+        "version": "Version",
+        "review_count": "Review count",
+        "downloads": "Downloads count",
+        "age_suitability": "Age suitability",
+        "updated_on": "Updated date",
+        "ads": "Ads information",
+    }
 
+    def __init__(self):
+        """Load categories; items are stored by PlaystoreScraperPipeline."""
         # Load categories from the CSV file
         csv_file_path = r"../output/categories.csv"
         self.categories = self.load_categories_from_csv(csv_file_path)
         self.category_limits = 5
         self.category_counts = {category: 0 for category in self.categories}
 
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        spider = super().from_crawler(crawler, *args, **kwargs)
+        spider.readiness = PageReadiness.from_crawler(crawler)
+        spider.timings = StageTimings.from_crawler(crawler)
+        return spider
+
     def start_requests(self):
         """Generate requests for each category."""
         for category, url in self.categories.items():
             yield scrapy.Request(
                 url=url,
                 callback=self.parse,
-                meta={"category": category, "category_url": url},
+                meta={"category": category},
             )
 
     def parse(self, response):
         """Extract app links from category page."""
         category = response.meta["category"]
-        category_url = response.meta["category_url"]
-
-        self.driver.get(category_url)
-        time.sleep(2)
 
         app_links = response.xpath("//div[contains(@class,'zuJxTd')]//a/@href").getall()
-        app_links = [app.get_attribute("href") for app in app_links]
+
+        # With the static fast path, app pages are only rendered if the plain
+        # HTTP response is missing fields
+        render = not self.settings.getbool("STATIC_FAST_PATH")
 
         for link in app_links[: self.category_limits]:
             if self.category_counts[category] < self.category_limits:
@@ -58,109 +87,85 @@ class PlaystoreSpider(scrapy.Spider):
                 yield scrapy.Request(
                     url=full_url,
                     callback=self.extract_app,
-                    meta={"category": category, "category_url": category_url},
+                    meta={
+                        "category": category,
+                        "selenium": render,
+                        "selenium_action": "extract_app_details",
+                    },
                 )
 
     def extract_app(self, response):
         """Extract app details from the category page."""
         category = response.meta["category"]
-        category_url = response.meta["category_url"]
 
-        self.driver.get(response.url)
-        time.sleep(2)
-
-        try:
-            button = self.driver.find_element(
-                By.XPATH, "//div[@class='VMq4uf']//button"
+        if response.meta.get("selenium"):
+            details = dict(response.meta["selenium_result"])
+            static_data = response.meta.get("static_data") or {}
+            details.update({key: value for key, value in static_data.items() if value})
+        else:
+            with self.timings.time("static_parse"):
+                details = parse_app_response(response)
+            missing = [
+                field
+                for field in self.settings.getlist("STATIC_REQUIRED_FIELDS")
+                if field in self.detail_xpaths and not details.get(field)
+            ]
+            if missing:
+                self.logger.debug(
+                    f"Rendering {response.url}, missing from static page: {missing}"
+                )
+                yield response.request.replace(
+                    dont_filter=True,
+                    meta=dict(response.meta, selenium=True, static_data=details),
+                )
+                return
+
+        with self.timings.time("preprocess"):
+            app_data = AppItem(
+                package_id=package_id_from_url(response.url),
+                category=category,
+                title=details["title"],
+                rating=parse_rating(details["rating"]),
+                version=clean_text(details["version"]),
+                review_count=parse_count(details["review_count"]),
+                downloads=parse_count(details["downloads"]),
+                age_suitability=clean_text(
+                    (details["age_suitability"] or "").replace("Rated for", "")
+                ),
+                updated_on=parse_date(details["updated_on"]),
+                ads=parse_flag(details["ads"] or "", "ads"),
+                scraped_at=datetime.now(timezone.utc).isoformat(timespec="seconds"),
             )
-            if button.is_displayed():
-                self.driver.execute_script("arguments[0].click();", button)
-                time.sleep(2)
-        except NoSuchElementException:
-            self.logger.info("No expandable 'Read More' section found for this app.")
-
-        try:
-            title = self.driver.find_element(By.XPATH, "//h1/span").text
-        except NoSuchElementException:
-            self.logger.warning("Title not found.")
-            title = None
 
-        try:
-            rating = self.driver.find_element(
-                By.XPATH, "//div[@class='ClM7O']//div"
-            ).text
-        except NoSuchElementException:
-            self.logger.warning("Rating not found.")
-            rating = None
+        yield app_data
 
-        try:
-            version = self.driver.find_element(
-                By.XPATH,
-                "(//div[@class='reAt0'])[1] | //div[contains(@class, 'q078ud') and contains(text(), 'Version')]/following-sibling::div[@class='reAt0']",
-            ).text
-        except NoSuchElementException:
-            self.logger.warning("Version not found.")
-            version = None
+    def extract_app_details(self, driver, request):
+        """Read the raw app details from a rendered app page.
 
-        try:
-            review_count = self.driver.find_element(
-                By.XPATH, "//div[contains(@class,'g1rdde')][1]"
-            ).text
-        except NoSuchElementException:
-            self.logger.warning("Review count not found.")
-            review_count = None
+        Runs on a browser thread of the downloader middleware. The page is
+        loaded on its own, so nothing needs restoring afterwards.
+        """
+        from selenium.webdriver.common.by import By
 
-        try:
-            downloads = self.driver.find_element(
-                By.XPATH, "//div[contains(@class,'wVqUob')][2]/div"
-            ).text
-        except NoSuchElementException:
-            self.logger.warning("Downloads count not found.")
-            downloads = None
+        self.readiness.wait(driver, "app_title")
 
         try:
-            age_suitability = self.driver.find_element(
-                By.XPATH, "//span[@itemprop='contentRating']"
-            ).text
+            button = driver.find_element(By.XPATH, "//div[@class='VMq4uf']//button")
+            if button.is_displayed():
+                driver.execute_script("arguments[0].click();", button)
+                self.readiness.wait(driver, "details_dialog")
         except NoSuchElementException:
-            self.logger.warning("Age suitability not found.")
-            age_suitability = None
+            self.logger.info("No expandable 'Read More' section found for this app.")
 
-        try:
-            updated_on = self.driver.find_element(
-                By.XPATH, "//div[contains(@class, 'xg1aie')]"
-            ).text
-        except NoSuchElementException:
-            self.logger.warning("Updated date not found.")
-            updated_on = None
+        # Read all fields in a single browser call
+        with self.timings.time("extract"):
+            details = extract_fields(driver, self.detail_xpaths)
 
-        try:
-            ads = self.driver.find_element(
-                By.XPATH, "//span[contains(@class, 'UIuSk')]"
-            ).text
-        except NoSuchElementException:
-            self.logger.warning("Ads information not found.")
-            ads = None
-        updated_on = datetime.strptime(updated_on, "%b %d, %Y").strftime("%Y/%m/%d")
-
-        app_data = {
-            "category": category,
-            "title": title,
-            "rating": rating.replace("star", ""),
-            "version": version,
-            "review_count": review_count.replace("reviews", "").strip(),
-            "downloads": downloads,
-            "age_suitability": age_suitability.replace("Rated for", "").strip(),
-            "updated_on": updated_on,
-            "ads": ads,
-        }
-
-        self.db_manager.insert_app_data(app_data)
-        yield app_data
+        for key, value in details.items():
+            if value is None:
+                self.logger.warning(f"{self.detail_labels[key]} not found.")
 
-        self.logger.info(f"Returning to category page : {category_url}")
-        self.driver.get(category_url)
-        time.sleep(2)
+        return details
 
     def load_categories_from_csv(self, csv_file_path):
         categories = {}
@@ -182,6 +187,5 @@ class PlaystoreSpider(scrapy.Spider):
         return categories
 
     def closed(self, reason):
-        """Close Selenium WebDriver and DatabaseManager."""
-        self.driver.quit()
-        self.db_manager.close()
+        """Log why the spider finished."""
+        self.logger.info(f"Spider closed due to: {reason}")
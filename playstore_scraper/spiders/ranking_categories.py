@@ -1,10 +1,8 @@
 # Import necessary libraries
 import scrapy
-import re
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.chrome.options import Options
-import time
+from playstore_scraper.extractors import extract_app_details, extract_records
+from playstore_scraper.readiness import PageReadiness, RANKING_APPS_XPATH
+from playstore_scraper.timing import StageTimings
 
 
 class PlayStoreSpider(scrapy.Spider):
@@ -16,7 +14,7 @@ class PlayStoreSpider(scrapy.Spider):
     - Navigates to a specified category page on the Play Store.
     - Clicks on category tabs (Top Free, Top Grossing, Top Paid).
     - Extracts app details such as title, link, and price.
-    - Clicks on each app to retrieve its price (if applicable).
+    - Loads each app page separately to retrieve its price (if applicable).
     - Returns the extracted data as a Scrapy item.
     """
 
@@ -26,17 +24,51 @@ class PlayStoreSpider(scrapy.Spider):
         "https://play.google.com/store/apps/category/BOOKS_AND_REFERENCE?hl=en"
     ]
 
-    def __init__(self):
-        # Set up Selenium WebDriver with Chrome options
-        chrome_options = Options()
-        chrome_options.add_argument("--disable-gpu")
-        chrome_options.add_argument("--no-sandbox")
-        self.driver = webdriver.Chrome(options=chrome_options)
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        spider = super().from_crawler(crawler, *args, **kwargs)
+        spider.readiness = PageReadiness.from_crawler(crawler)
+        spider.timings = StageTimings.from_crawler(crawler)
+        return spider
+
+    def start_requests(self):
+        # Category pages are rendered by the Selenium downloader middleware
+        for url in self.start_urls:
+            yield scrapy.Request(
+                url=url,
+                callback=self.parse,
+                meta={"selenium": True, "selenium_action": "collect_rankings"},
+            )
 
     def parse(self, response):
-        # Open the Play Store category page in Selenium
-        self.driver.get(response.url)
-        time.sleep(3)  # Wait for the page to load
+        # Each app is loaded on its own, so the category page never has to be
+        # restored between apps
+        for app in response.meta["selenium_result"]:
+            app["link"] = response.urljoin(app["link"])
+            yield scrapy.Request(
+                url=app["link"],
+                callback=self.parse_app,
+                dont_filter=True,  # An app may be listed under several tabs
+                meta={
+                    "app": app,
+                    "selenium": True,
+                    "selenium_action": "extract_price",
+                },
+            )
+
+    def parse_app(self, response):
+        # Yield extracted data as a Scrapy item
+        yield dict(response.meta["app"], price=response.meta["selenium_result"])
+
+    def collect_rankings(self, driver, request):
+        """Walk the ranking tabs of a category page and collect app titles and links.
+
+        Runs on a browser thread of the downloader middleware.
+        """
+        from selenium.webdriver.common.by import By
+
+        self.readiness.wait(driver, "category_page")
+        rankings = []
 
         # Dictionary mapping category names to their button IDs
         categories = {
@@ -47,94 +79,57 @@ class PlayStoreSpider(scrapy.Spider):
 
         for category_name, button_id in categories.items():
             try:
+                # Remember the first app shown so we can tell when the section
+                # has been re-rendered. Top Free is showing when the page loads.
+                previous = None
+                if category_name != "Top Free":
+                    shown_apps = driver.find_elements(By.XPATH, RANKING_APPS_XPATH)
+                    previous = shown_apps[0] if shown_apps else None
+
                 # Click the button to open the category
-                button = self.driver.find_element(By.ID, button_id)
-                self.driver.execute_script("arguments[0].click();", button)
-                time.sleep(3)  # Wait for apps to load
-
-                # Locate all app elements in the category
-                app_elements = self.driver.find_elements(
-                    By.XPATH,
-                    "//section[contains(@jscontroller,'IgeFAf')]//div[contains(@class,'ULeU3b neq64b')]",
-                )
-
-                # Extract details of the first 5 apps in the category
-                for i in range(5):
-                    if i >= len(
-                        app_elements
-                    ):  # Handle cases where there are fewer than 5 apps
-                        self.logger.warning(
-                            f"Not enough apps in {category_name}. Skipping app {i + 1}."
-                        )
-                        break
-
-                    try:
-                        app = app_elements[i]  # Select the app element by index
-
-                        # Get the app title
-                        title_element = app.find_element(
-                            By.XPATH, ".//div[contains(@class,'ubGTjb')][1]"
-                        )
-                        app_title = title_element.text
-
-                        # Get the app link
-                        app_link_element = app.find_element(By.TAG_NAME, "a")
-                        app_link = app_link_element.get_attribute("href")
-
-                        # Click the app link to open the app details page
-                        self.driver.execute_script(
-                            "arguments[0].click();", app_link_element
-                        )
-                        time.sleep(3)  # Wait for the app page to load
-
-                        # Initialize price variable
-                        price = " "
-
-                        try:
-                            # Check if the app has an "Install" button (indicating a free app)
-                            install_button = self.driver.find_element(
-                                By.XPATH, "//button[contains(@aria-label, 'Install')]"
-                            )
-                            if install_button:
-                                price = "Free"
-
-                        except Exception:
-                            # If no "Install" button is found, check for a price button (e.g., "$11.05 Buy")
-                            try:
-                                price_element = self.driver.find_element(
-                                    By.XPATH,
-                                    "(//div[contains(@class,'u4ICaf')]//button)[1]",
-                                )
-                                price_text = price_element.get_attribute("aria-label")
-
-                                # Extract the price if it contains a "$" symbol
-                                if "$" in price_text:
-                                    price = re.sub(r"\s*Buy\s*", "", price_text).strip()
-                                else:
-                                    price = "Not Available"
-                            except Exception:
-                                price = "Not Available"
-
-                        # Navigate back to the category page
-                        self.driver.back()
-                        time.sleep(3)  # Wait for the page to reload
-
-                        # Yield extracted data as a Scrapy item
-                        yield {
+                button = driver.find_element(By.ID, button_id)
+                driver.execute_script("arguments[0].click();", button)
+                self.readiness.wait(driver, "ranking_section", previous)
+
+                # Read title and link of the first 5 apps in one browser call
+                with self.timings.time("extract"):
+                    apps = extract_records(
+                        driver,
+                        "//section[contains(@jscontroller,'IgeFAf')]//div[contains(@class,'ULeU3b neq64b')]",
+                        {
+                            "title": ".//div[contains(@class,'ubGTjb')][1]",
+                            "link": ".//a/@href",
+                        },
+                        limit=5,
+                    )
+
+                # Handle cases where there are fewer than 5 apps
+                if len(apps) < 5:
+                    self.logger.warning(
+                        f"Not enough apps in {category_name}. Skipping app {len(apps) + 1}."
+                    )
+
+                for app in apps:
+                    rankings.append(
+                        {
                             "category": category_name,
-                            "title": app_title,
-                            "link": app_link,
-                            "price": price,
+                            "title": app["title"],
+                            "link": app["link"],
                         }
-
-                    except Exception as e:
-                        self.logger.error(
-                            f"Could not process app {i + 1} under {category_name}: {e}"
-                        )
+                    )
 
             except Exception as e:
                 self.logger.error(f"Could not click {category_name}: {e}")
 
-    def closed(self, reason):
-        """Close the browser when the spider finishes."""
-        self.driver.quit()
+        return rankings
+
+    def extract_price(self, driver, request):
+        """Read the price from a rendered app page.
+
+        Runs on a browser thread of the downloader middleware.
+        """
+        self.readiness.wait(driver, "app_title")
+
+        # Read the install and buy buttons in a single browser call
+        with self.timings.time("extract"):
+            return extract_app_details(driver, xpaths={})["price"]
@@ -1,9 +1,17 @@
 import scrapy
-import time
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.chrome.options import Options
+import sqlite3
+import threading
 from playstore_scraper.database import DatabaseManager
+from playstore_scraper.extractors import (
+    extract_reviews,
+    package_id_from_url,
+    PAGE_REVIEW_CONTAINER_XPATH,
+    REVIEW_CONTAINER_XPATH,
+)
+from playstore_scraper.items import AppReviewsItem
+from playstore_scraper.normalize import parse_date
+from playstore_scraper.readiness import PageReadiness
+from playstore_scraper.timing import StageTimings
 import csv
 import os
 
@@ -13,17 +21,14 @@ class PlayStore(scrapy.Spider):
     allowed_domains = ["play.google.com"]
 
     def __init__(self):
-        """Initialize Selenium WebDriver, Database, and CSV."""
-        # Set up Selenium WebDriver
-        chrome_options = Options()
-        # chrome_options.add_argument("--headless")
-        chrome_options.add_argument("--no-sandbox")
-        chrome_options.add_argument("--disable-dev-shm-usage")
-        self.driver = webdriver.Chrome(options=chrome_options)
-
-        # Database file
-        self.db_manager = DatabaseManager()
-        self.db_manager.create_reviews_table()
+        """Read the categories to crawl.
+
+        Reviews are stored by PlaystoreScraperPipeline, which also looks up
+        the app they belong to. Browser threads only open read-only
+        connections, to check which reviews are stored already.
+        """
+        self.review_lookup = threading.local()
+        self.review_lookup_dbs = []
 
         # Read categories from CSV
         self.categories = self.read_categories_from_csv("../output/categories.csv")
@@ -36,6 +41,13 @@ class PlayStore(scrapy.Spider):
         self.category_limit = 15
         self.category_counts = {cat["Category"]: 0 for cat in self.categories}
 
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        spider = super().from_crawler(crawler, *args, **kwargs)
+        spider.readiness = PageReadiness.from_crawler(crawler)
+        spider.timings = StageTimings.from_crawler(crawler)
+        return spider
+
     def parse(self, response):
         """Extract app links from category page."""
         category = self.category_url_map.get(response.url, "Unknown")
@@ -46,100 +58,189 @@ class PlayStore(scrapy.Spider):
                 full_url = response.urljoin(link)
                 self.category_counts[category] += 1
                 yield scrapy.Request(
-                    url=full_url, callback=self.parse_app, meta={"category": category}
+                    url=full_url,
+                    callback=self.parse_app,
+                    meta={
+                        "category": category,
+                        "selenium": True,
+                        "selenium_action": "extract_reviews",
+                    },
                 )
 
     def parse_app(self, response):
-        """Extract app details and reviews, using auto-incrementing app ID."""
-        category = response.meta.get("category")
-        self.driver.get(response.url)
-        time.sleep(2)
+        """Yield the review chunks that did not reach the writer yet.
 
-        # Extract app title
-        try:
-            title = self.driver.find_element(By.XPATH, "//h1/span").text.strip()
-        except Exception:
-            self.logger.info("Error extracting app title ")
+        Those are the chunks of a crawl without PlaystoreScraperPipeline, and
+        every chunk of a replayed crawl, whose page actions never ran.
+        """
+        result = response.meta["selenium_result"]
+        if result is None:
             return
 
-        if not self.db_manager.app_exists_in_playstore(title):
-            self.logger.info(
-                f"Skipping review extraction for {title}, not found in playstore_data.db apps table."
-            )
-            return
+        self.logger.info(f"Harvested {result['count']} reviews of {result['title']}")
 
-        app_id = self.db_manager.get_app_id(title)
-        if app_id is None:
-            self.logger(f"App '{title}' not found in database")
+        if result["streamed"] and "replayed" not in response.flags:
             return
+        for chunk in result["chunks"]:
+            yield AppReviewsItem(chunk)
+
+    def extract_reviews(self, driver, request):
+        """Harvest the reviews of an app, scrolling the reviews dialog for more.
+
+        Runs on a browser thread of the downloader middleware. Reviews are
+        sent to the database writer in chunks of REVIEWS_CHUNK_SIZE while the
+        dialog is scrolled, so memory use does not grow with the number of
+        reviews, except in a recorded crawl (REPLAY_MODE = "record"), whose
+        recording keeps every chunk for replays. Returns None if the page has
+        no title.
+        """
+        from selenium.webdriver.common.by import By
+
+        self.readiness.wait(driver, "app_title")
+
+        # Extract app title
+        try:
+            title = driver.find_element(By.XPATH, "//h1/span").text.strip()
+        except Exception:
+            self.logger.info("Error extracting app title ")
+            return None
 
         # Click the "See All Reviews" button if available
         try:
-            see_all_reviews_button = self.driver.find_element(
+            see_all_reviews_button = driver.find_element(
                 By.XPATH,
                 "//button[@jscontroller='soHxf']//span[contains(text(), 'See all reviews')]",
             )
-            self.driver.execute_script("arguments[0].click();", see_all_reviews_button)
-            time.sleep(3)
+            driver.execute_script("arguments[0].click();", see_all_reviews_button)
+            dialog_open = self.readiness.wait(driver, "reviews_dialog")
         except Exception:
             self.logger.info("No 'See All Reviews' button found.")
+            dialog_open = False
 
-        # Extract reviews
-        reviews = []
-        review_elements = self.driver.find_elements(By.XPATH, "//div[@class='h3YV2d']")
-        reviewer_name_elements = self.driver.find_elements(
-            By.XPATH, "//div[@class='X5PpBb']"
-        )
-        review_date_elements = self.driver.find_elements(
-            By.XPATH, "//span[@class='bp9Aid']"
-        )
-        review_rating_elements = self.driver.find_elements(
-            By.XPATH, "//div[@class='Jx4nYe']//div[@class='iXRFPc']"
+        # Chunks are kept as plain dicts, which a recording can store, when
+        # there is no writer to stream them to or the crawl is recorded
+        writer = getattr(self.crawler, "db_writer", None)
+        result = {
+            "title": title,
+            "count": 0,
+            "streamed": writer is not None,
+            "chunks": [],
+        }
+        keep_chunks = writer is None or self.settings.get("REPLAY_MODE") == "record"
+        chunk_size = max(1, self.settings.getint("REVIEWS_CHUNK_SIZE", 100))
+        chunk = []
+
+        package_id = package_id_from_url(request.url)
+        for review in self.harvest_reviews(driver, package_id, dialog_open):
+            chunk.append(review)
+            if len(chunk) >= chunk_size:
+                self.emit_reviews(request, result, chunk, writer, keep_chunks)
+                chunk = []
+        if chunk:
+            self.emit_reviews(request, result, chunk, writer, keep_chunks)
+
+        self.crawler.stats.inc_value("reviews/harvested", result["count"])
+        return result
+
+    def harvest_reviews(self, driver, package_id, dialog_open=True):
+        """Yield the reviews of the open reviews dialog, loading more as needed.
+
+        Stops after REVIEWS_MAX_PER_APP reviews, when scrolling loads nothing
+        new, or when a loaded page only holds reviews older than
+        REVIEWS_DATE_CUTOFF or, with REVIEWS_STOP_AT_STORED, reviews that are
+        already in the database. Stored reviews are never yielded again.
+        Without the dialog, only the reviews shown on the app page are read.
+        """
+        container_xpath = (
+            REVIEW_CONTAINER_XPATH if dialog_open else PAGE_REVIEW_CONTAINER_XPATH
         )
+        max_reviews = self.settings.getint("REVIEWS_MAX_PER_APP", 0)
+        cutoff = self.settings.get("REVIEWS_DATE_CUTOFF")
+        stop_at_stored = self.settings.getbool("REVIEWS_STOP_AT_STORED")
+        seen = 0
+        harvested = 0
 
-        # Ensure review data is extracted properly
-        for i in range(len(review_elements)):
-            review_text = (
-                review_elements[i].text.strip()
-                if i < len(review_elements) and review_elements[i].text.strip()
-                else None
-            )
-            reviewer_name = (
-                reviewer_name_elements[i].text.strip()
-                if i < len(reviewer_name_elements)
-                else None
-            )
-            review_date = (
-                review_date_elements[i].text.strip()
-                if i < len(review_date_elements)
-                else None
-            )
-            review_rating = (
-                review_rating_elements[i].get_attribute("aria-label").split()[1]
-                if i < len(review_rating_elements)
-                else None
-            )
+        while True:
+            # One browser call for the whole page of review cards
+            with self.timings.time("extract"):
+                page = extract_reviews(
+                    driver, start=seen, container_xpath=container_xpath
+                )
+            seen += len(page)
 
-            # Only include non-empty reviews
-            if review_text:
-                reviews.append(
-                    {
-                        "review_text": review_text,
-                        "reviewer_name": reviewer_name or "Anonymous",
-                        "review_date": review_date or "Unknown",
-                        "review_rating": review_rating or "No Rating",
-                    }
+            stored = set()
+            if stop_at_stored:
+                stored = self.stored_review_keys(
+                    package_id, [review["review_key"] for review in page]
                 )
+                self.crawler.stats.inc_value("reviews/already_stored", len(stored))
 
-        yield {
-            "app_id": app_id,
-            "category": category,
-            "title": title,
-            "reviews": reviews,
-            "rating": review_rating,
-        }
+            fresh = 0
+            for review in page:
+                review_date = parse_date(review["review_date"])
+                if cutoff and review_date and review_date < cutoff:
+                    continue
+                if review["review_key"] in stored:
+                    continue
+                fresh += 1
+
+                # Only include non-empty reviews
+                if not review["review_text"]:
+                    continue
+                yield review
+                harvested += 1
+                if max_reviews and harvested >= max_reviews:
+                    return
+
+            if page and not fresh:
+                return
+            if not dialog_open or not self.load_more_reviews(driver, seen):
+                return
+
+    def load_more_reviews(self, driver, seen):
+        """Scroll to the last review and wait for the next page of reviews."""
+        driver.execute_script(
+            """
+            var reviews = document.evaluate(
+                arguments[0], document, null,
+                XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null
+            );
+            if (reviews.snapshotLength) {
+                reviews.snapshotItem(reviews.snapshotLength - 1).scrollIntoView();
+            }
+            """,
+            REVIEW_CONTAINER_XPATH,
+        )
+        return self.readiness.wait(driver, "more_reviews", seen)
 
-        self.db_manager.insert_review_data(app_id, reviews)
+    def stored_review_keys(self, package_id, keys):
+        """Return which of ``keys`` are stored for the app, from a browser thread."""
+        db = getattr(self.review_lookup, "db", None)
+        try:
+            if db is None:
+                db = DatabaseManager(self.settings.get("DB_NAME"), read_only=True)
+                self.review_lookup.db = db
+                self.review_lookup_dbs.append(db)
+            return db.stored_review_keys(package_id, keys)
+        except sqlite3.OperationalError:
+            # No database or reviews table yet: nothing is stored
+            return set()
+
+    def emit_reviews(self, request, result, reviews, writer, keep_chunks):
+        """Send one chunk of reviews to the database writer, if there is one."""
+        item = AppReviewsItem(
+            package_id=package_id_from_url(request.url),
+            category=request.meta.get("category"),
+            title=result["title"],
+            reviews=reviews,
+            rating=reviews[-1]["review_rating"],
+        )
+        result["count"] += len(reviews)
+
+        if keep_chunks:
+            result["chunks"].append(dict(item))
+        if writer is not None:
+            writer.submit(item)
 
     def read_categories_from_csv(self, file_path):
         """Read categories.csv and return category names with URLs."""
@@ -171,5 +272,8 @@ class PlayStore(scrapy.Spider):
         return categories
 
     def closed(self, reason):
-        """Close Selenium WebDriver."""
-        self.driver.quit()
+        """Log why the spider finished and close the lookup connections."""
+        self.logger.info(f"Spider closed due to: {reason}")
+
+        for db in self.review_lookup_dbs:
+            db.conn.close()
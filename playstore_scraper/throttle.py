@@ -0,0 +1,178 @@
+"""
+Adaptive concurrency and pacing for browser-rendered requests.
+
+Scrapy's AutoThrottle only sees the regular downloader, so rendered pages are
+paced here instead. RenderThrottle limits how many browsers load pages at the
+same time and how far apart page loads start, and adjusts both from what the
+pages report:
+
+- a block signal (see ``record``) halves the concurrency and doubles the delay
+  at once;
+- after every RENDER_THROTTLE_WINDOW pages, an error rate above
+  RENDER_THROTTLE_MAX_ERROR_RATE or an average ``driver.get`` latency above
+  RENDER_THROTTLE_TARGET_LATENCY takes one browser away and lengthens the
+  delay, while a healthy window adds one browser and shortens the delay.
+
+Concurrency stays between RENDER_THROTTLE_MIN_CONCURRENCY and
+RENDER_THROTTLE_MAX_CONCURRENCY (SELENIUM_POOL_SIZE by default), and the delay
+between RENDER_THROTTLE_MIN_DELAY and RENDER_THROTTLE_MAX_DELAY seconds.
+"""
+
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class RenderThrottle:
+    """Admit browser page loads at an adaptive concurrency and rate.
+
+    Used from the browser threads of the downloader middleware.
+    """
+
+    def __init__(
+        self,
+        target_latency=8.0,
+        min_concurrency=1,
+        max_concurrency=4,
+        start_concurrency=1,
+        min_delay=0.0,
+        max_delay=30.0,
+        max_error_rate=0.2,
+        window=10,
+        stats=None,
+    ):
+        self.target_latency = target_latency
+        self.min_concurrency = max(1, min_concurrency)
+        self.max_concurrency = max(self.min_concurrency, max_concurrency)
+        self.min_delay = min_delay
+        self.max_delay = max(min_delay, max_delay)
+        self.max_error_rate = max_error_rate
+        self.window = max(1, window)
+        self.stats = stats
+
+        self.concurrency = min(
+            max(start_concurrency, self.min_concurrency), self.max_concurrency
+        )
+        self.delay = min_delay
+        self.active = 0
+        self.next_start = 0.0
+
+        # Pages seen since the last adjustment
+        self.pages = 0
+        self.errors = 0
+        self.latency_total = 0.0
+
+        self._condition = threading.Condition()
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        max_concurrency = settings.get("RENDER_THROTTLE_MAX_CONCURRENCY")
+        throttle = cls(
+            target_latency=settings.getfloat("RENDER_THROTTLE_TARGET_LATENCY", 8.0),
+            min_concurrency=settings.getint("RENDER_THROTTLE_MIN_CONCURRENCY", 1),
+            max_concurrency=int(
+                max_concurrency or settings.getint("SELENIUM_POOL_SIZE", 1)
+            ),
+            start_concurrency=settings.getint("RENDER_THROTTLE_START_CONCURRENCY", 1),
+            min_delay=settings.getfloat("RENDER_THROTTLE_MIN_DELAY", 0.0),
+            max_delay=settings.getfloat("RENDER_THROTTLE_MAX_DELAY", 30.0),
+            max_error_rate=settings.getfloat("RENDER_THROTTLE_MAX_ERROR_RATE", 0.2),
+            window=settings.getint("RENDER_THROTTLE_WINDOW", 10),
+            stats=crawler.stats,
+        )
+        throttle.publish()
+        return throttle
+
+    def acquire(self):
+        """Block until a page load may start, and take a slot for it."""
+        with self._condition:
+            while self.active >= self.concurrency:
+                self._condition.wait()
+            self.active += 1
+            start = max(time.monotonic(), self.next_start)
+            self.next_start = start + self.delay
+        time.sleep(max(0.0, start - time.monotonic()))
+
+    def release(self):
+        """Free the slot of a finished page load."""
+        with self._condition:
+            self.active -= 1
+            self._condition.notify_all()
+
+    def record(self, latency=None, error=False, blocked=False):
+        """Report one page load.
+
+        ``latency`` is the ``driver.get`` time in seconds, None if the load
+        failed. ``error`` marks a failed render and ``blocked`` a page the
+        store refused to serve.
+        """
+        with self._condition:
+            if blocked:
+                self.back_off("blocked")
+                return
+
+            self.pages += 1
+            self.errors += bool(error)
+            if latency is not None:
+                self.latency_total += latency
+            if self.pages >= self.window:
+                self.adjust()
+
+    def adjust(self):
+        """Move concurrency and delay after a full window of pages."""
+        loaded = self.pages - self.errors
+        latency = self.latency_total / loaded if loaded else None
+        error_rate = self.errors / self.pages
+        self.pages = self.errors = 0
+        self.latency_total = 0.0
+
+        if error_rate > self.max_error_rate:
+            self.slow_down("errors")
+        elif latency is not None and latency > self.target_latency:
+            self.slow_down("latency")
+        else:
+            self.speed_up()
+
+        if latency is not None and self.stats is not None:
+            self.stats.set_value("render_throttle/latency_ms", round(latency * 1000))
+
+    def back_off(self, reason):
+        """Halve concurrency and double the delay right away."""
+        self.concurrency = max(self.min_concurrency, self.concurrency // 2)
+        self.delay = min(self.max_delay, max(self.delay * 2, 1.0, self.min_delay))
+        self.changed(reason)
+
+    def slow_down(self, reason):
+        """Take one browser away and lengthen the delay by half."""
+        self.concurrency = max(self.min_concurrency, self.concurrency - 1)
+        self.delay = min(self.max_delay, max(self.delay * 1.5, 0.5, self.min_delay))
+        self.changed(reason)
+
+    def speed_up(self):
+        """Add one browser and shorten the delay by a quarter."""
+        concurrency = min(self.max_concurrency, self.concurrency + 1)
+        delay = max(self.min_delay, self.delay * 0.75)
+        if delay - self.min_delay < 0.05:
+            delay = self.min_delay
+        if (concurrency, delay) == (self.concurrency, self.delay):
+            return
+        self.concurrency, self.delay = concurrency, delay
+        self._condition.notify_all()
+        self.changed("speed_up")
+
+    def changed(self, reason):
+        logger.debug(
+            f"Render throttle ({reason}): concurrency {self.concurrency}, "
+            f"delay {self.delay:.2f}s"
+        )
+        if self.stats is not None:
+            self.stats.inc_value(f"render_throttle/{reason}")
+        self.publish()
+
+    def publish(self):
+        if self.stats is not None:
+            self.stats.set_value("render_throttle/concurrency", self.concurrency)
+            self.stats.set_value("render_throttle/delay_ms", round(self.delay * 1000))
@@ -0,0 +1,205 @@
+"""
+Per-stage timing of the crawl hot path.
+
+The Selenium middleware, the readiness waits, the spiders and the database
+writer time each stage of their work (``driver_get``, ``wait_<condition>``,
+``extract``, ``preprocess``, ``db_write``, ...) through one StageTimings per
+crawl. Every stage keeps a bounded sample of its durations. Counts and maxima
+are in the crawl stats under ``timing/<stage>/...`` as they happen; p50 and
+p95 are added every TIMING_EXPORT_INTERVAL seconds and when the spider closes.
+With TIMING_EXPORT_PATH set, the same summaries are also written to a file,
+in TIMING_EXPORT_FORMAT ("json" or "prometheus"). By default that is JSON if
+the path ends in ``.json`` and Prometheus text format otherwise.
+"""
+
+import json
+import logging
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+from scrapy import signals
+from twisted.internet import task
+
+logger = logging.getLogger(__name__)
+
+# Durations kept per stage. Past this, a uniform random sample is kept.
+MAX_SAMPLES = 10000
+
+PROMETHEUS_METRIC = "playstore_stage_duration_milliseconds"
+
+EXPORT_FORMATS = ("json", "prometheus")
+
+
+class StageHistogram:
+    """Durations of one stage, in milliseconds."""
+
+    def __init__(self, max_samples=MAX_SAMPLES):
+        self.max_samples = max_samples
+        self.samples = []
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, value):
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+        if len(self.samples) < self.max_samples:
+            self.samples.append(value)
+        else:
+            # Reservoir sampling keeps memory bounded on long crawls
+            index = random.randrange(self.count)
+            if index < self.max_samples:
+                self.samples[index] = value
+
+    def summary(self):
+        samples = sorted(self.samples)
+
+        def percentile(q):
+            return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+        return {
+            "count": self.count,
+            "sum_ms": round(self.total, 1),
+            "p50_ms": round(percentile(0.5), 1),
+            "p95_ms": round(percentile(0.95), 1),
+            "max_ms": round(self.max, 1),
+        }
+
+
+class StageTimings:
+    """Collect stage durations from every thread of a crawl.
+
+    ``from_crawler`` returns one shared instance per crawler, so the
+    extension entry in EXTENSIONS and every component that times a stage
+    report to the same histograms. Spiders create it before the crawler has a
+    stats collector, so the stats are only bound when the spider opens.
+    """
+
+    def __init__(
+        self, stats=None, export_path=None, export_format=None, export_interval=0
+    ):
+        self.stats = stats
+        self.export_path = export_path
+        self.export_format = export_format or (
+            "json" if str(export_path).endswith(".json") else "prometheus"
+        )
+        if self.export_format not in EXPORT_FORMATS:
+            raise ValueError(f"Unknown timing export format: {self.export_format}")
+        self.export_interval = export_interval
+        self.histograms = {}
+        self.export_task = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        timings = getattr(crawler, "stage_timings", None)
+        if timings is not None:
+            return timings
+
+        settings = crawler.settings
+        timings = cls(
+            export_path=settings.get("TIMING_EXPORT_PATH"),
+            export_format=settings.get("TIMING_EXPORT_FORMAT"),
+            export_interval=settings.getfloat("TIMING_EXPORT_INTERVAL", 0),
+        )
+        crawler.signals.connect(timings.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(timings.spider_closed, signal=signals.spider_closed)
+        crawler.stage_timings = timings
+        return timings
+
+    @contextmanager
+    def time(self, stage):
+        """Time the body of a ``with`` block as one run of ``stage``."""
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.record(stage, time.monotonic() - start)
+
+    def record(self, stage, elapsed):
+        """Add one run of ``stage`` that took ``elapsed`` seconds."""
+        elapsed_ms = elapsed * 1000
+        with self._lock:
+            histogram = self.histograms.get(stage)
+            if histogram is None:
+                histogram = self.histograms[stage] = StageHistogram()
+            histogram.add(elapsed_ms)
+
+            if self.stats is not None:
+                self.stats.inc_value(f"timing/{stage}/count")
+                self.stats.max_value(f"timing/{stage}/max_ms", int(elapsed_ms))
+
+    def summaries(self):
+        with self._lock:
+            return {
+                stage: histogram.summary()
+                for stage, histogram in sorted(self.histograms.items())
+            }
+
+    def publish(self):
+        """Put percentiles in the stats and write the export file, if any."""
+        summaries = self.summaries()
+
+        if self.stats is not None:
+            with self._lock:
+                for stage, summary in summaries.items():
+                    self.stats.set_value(f"timing/{stage}/p50_ms", summary["p50_ms"])
+                    self.stats.set_value(f"timing/{stage}/p95_ms", summary["p95_ms"])
+
+        if self.export_path:
+            try:
+                self.export(summaries)
+            except OSError as e:
+                logger.error(f"Could not write stage timings: {e}")
+
+    def export(self, summaries):
+        if self.export_format == "json":
+            data = json.dumps(summaries, indent=2)
+        else:
+            data = self.prometheus_text(summaries)
+
+        tmp_path = f"{self.export_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(data)
+        os.replace(tmp_path, self.export_path)
+
+    def prometheus_text(self, summaries):
+        """Format ``summaries`` as Prometheus summaries plus a max gauge."""
+        lines = [
+            f"# HELP {PROMETHEUS_METRIC} Time spent in each crawl stage.",
+            f"# TYPE {PROMETHEUS_METRIC} summary",
+        ]
+        for stage, summary in summaries.items():
+            label = f'stage="{stage}"'
+            lines.append(
+                f'{PROMETHEUS_METRIC}{{{label},quantile="0.5"}} {summary["p50_ms"]}'
+            )
+            lines.append(
+                f'{PROMETHEUS_METRIC}{{{label},quantile="0.95"}} {summary["p95_ms"]}'
+            )
+            lines.append(f"{PROMETHEUS_METRIC}_sum{{{label}}} {summary['sum_ms']}")
+            lines.append(f"{PROMETHEUS_METRIC}_count{{{label}}} {summary['count']}")
+
+        lines.append(f"# HELP {PROMETHEUS_METRIC}_max Slowest run of each crawl stage.")
+        lines.append(f"# TYPE {PROMETHEUS_METRIC}_max gauge")
+        for stage, summary in summaries.items():
+            lines.append(
+                f'{PROMETHEUS_METRIC}_max{{stage="{stage}"}} {summary["max_ms"]}'
+            )
+        return "\n".join(lines) + "\n"
+
+    def spider_opened(self, spider):
+        if self.stats is None:
+            self.stats = spider.crawler.stats
+        if self.export_interval > 0:
+            self.export_task = task.LoopingCall(self.publish)
+            self.export_task.start(self.export_interval, now=False)
+
+    def spider_closed(self, spider):
+        if self.export_task is not None and self.export_task.running:
+            self.export_task.stop()
+        self.publish()
@@ -0,0 +1,363 @@
+"""
+Shared work queue for splitting one crawl of the scrapers spider over workers.
+
+The queue is an SQLite file (WORK_QUEUE_DB) that every worker process opens.
+It holds one task per category page and per app found on them, so an app
+listed in several tabs or categories is scraped once. Workers
+lease a few tasks at a time. A lease belongs to one worker (WORKER_ID) and
+expires after WORK_QUEUE_VISIBILITY_TIMEOUT seconds unless that worker renews
+it, so tasks held by a worker that died go back to the others. A task that
+fails is retried until it has been attempted WORK_QUEUE_MAX_ATTEMPTS times.
+
+All workers write their items to the same DB_NAME database. An app task is
+done once the worker's database writer has committed its item, and fails if
+the item could not be stored.
+
+Check or reset a queue with:
+
+    python -m playstore_scraper.workqueue status work_queue.db
+    python -m playstore_scraper.workqueue reset work_queue.db
+"""
+
+import argparse
+import logging
+import os
+import socket
+import sqlite3
+import time
+
+from scrapy import signals
+from twisted.internet import task
+
+from playstore_scraper.extractors import package_id_from_url
+from playstore_scraper.items import AppItem
+from playstore_scraper.pipelines import item_store_failed, items_stored
+
+logger = logging.getLogger(__name__)
+
+CATEGORY = "category"
+APP = "app"
+
+
+def category_task_id(category):
+    return f"{CATEGORY}:{category}"
+
+
+def app_task_id(url):
+    return package_task_id(package_id_from_url(url))
+
+
+def package_task_id(package_id):
+    return f"{APP}:{package_id}"
+
+
+class WorkQueue:
+    """Leases crawl tasks from an SQLite file shared by several workers.
+
+    Used from the reactor thread of one worker only.
+    """
+
+    def __init__(
+        self,
+        path,
+        owner=None,
+        visibility_timeout=300.0,
+        max_attempts=3,
+        lease_batch=8,
+        stats=None,
+    ):
+        self.path = path
+        self.owner = owner or f"{socket.gethostname()}:{os.getpid()}"
+        self.visibility_timeout = visibility_timeout
+        self.max_attempts = max_attempts
+        self.lease_batch = lease_batch
+        self.stats = stats
+        self.heartbeat_task = None
+
+        # Task ids leased by this worker and not finished yet
+        self.in_flight = set()
+
+        # Autocommit, so other workers see every change right away. Leases
+        # take an explicit write transaction.
+        self.conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS tasks (
+                task_id TEXT PRIMARY KEY,
+                kind TEXT,  -- "category" or "app"
+                url TEXT,
+                category TEXT,
+                ranking_category TEXT,
+                state TEXT DEFAULT 'pending',  -- pending, leased, done, failed
+                owner TEXT,
+                lease_expires REAL,  -- Unix time
+                attempts INTEGER DEFAULT 0,
+                error TEXT
+            )
+            """
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_tasks_state ON tasks(state)")
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        queue = cls(
+            settings.get("WORK_QUEUE_DB"),
+            owner=settings.get("WORKER_ID"),
+            visibility_timeout=settings.getfloat("WORK_QUEUE_VISIBILITY_TIMEOUT", 300),
+            max_attempts=settings.getint("WORK_QUEUE_MAX_ATTEMPTS", 3),
+            lease_batch=settings.getint("WORK_QUEUE_LEASE_BATCH", 8),
+        )
+        crawler.signals.connect(queue.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(queue.spider_closed, signal=signals.spider_closed)
+        crawler.signals.connect(queue.item_scraped, signal=signals.item_scraped)
+        crawler.signals.connect(queue.spider_error, signal=signals.spider_error)
+        crawler.signals.connect(queue.items_stored, signal=items_stored)
+        crawler.signals.connect(queue.item_store_failed, signal=item_store_failed)
+        return queue
+
+    def inc_stat(self, name, count=1):
+        if self.stats is not None and count:
+            self.stats.inc_value(f"work_queue/{name}", count)
+
+    def add_categories(self, categories):
+        """Queue category pages, given as dicts with "category" and "url".
+
+        Categories that are already queued, by this or another worker, are
+        left as they are.
+        """
+        self.conn.executemany(
+            """
+            INSERT OR IGNORE INTO tasks (task_id, kind, url, category)
+            VALUES (?, ?, ?, ?)
+            """,
+            [
+                (
+                    category_task_id(item["category"]),
+                    CATEGORY,
+                    item["url"],
+                    item["category"],
+                )
+                for item in categories
+            ],
+        )
+
+    def add_apps(self, category, app_links):
+        """Queue the app pages found on a category page.
+
+        ``app_links`` maps each ranking category to absolute app URLs. Apps
+        already queued keep the category and ranking they were first queued
+        with.
+        """
+        self.conn.executemany(
+            """
+            INSERT OR IGNORE INTO tasks (task_id, kind, url, category, ranking_category)
+            VALUES (?, ?, ?, ?, ?)
+            """,
+            [
+                (
+                    app_task_id(url),
+                    APP,
+                    url,
+                    category,
+                    ranking_category,
+                )
+                for ranking_category, urls in app_links.items()
+                for url in urls
+            ],
+        )
+
+    def lease(self, limit=None):
+        """Lease up to ``limit`` pending or expired tasks to this worker.
+
+        Returns a list of task dicts. Expired tasks that have used up their
+        attempts are marked as failed instead.
+        """
+        now = time.time()
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            expired = self.conn.execute(
+                """
+                UPDATE tasks SET state = 'failed', owner = NULL,
+                    error = COALESCE(error, 'lease expired')
+                WHERE state = 'leased' AND lease_expires < ? AND attempts >= ?
+                """,
+                (now, self.max_attempts),
+            ).rowcount
+            rows = self.conn.execute(
+                """
+                SELECT task_id, kind, url, category, ranking_category, state
+                FROM tasks
+                WHERE state = 'pending' OR (state = 'leased' AND lease_expires < ?)
+                ORDER BY rowid
+                LIMIT ?
+                """,
+                (now, limit or self.lease_batch),
+            ).fetchall()
+            self.conn.executemany(
+                """
+                UPDATE tasks SET state = 'leased', owner = ?, lease_expires = ?,
+                    attempts = attempts + 1
+                WHERE task_id = ?
+                """,
+                [(self.owner, now + self.visibility_timeout, row[0]) for row in rows],
+            )
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+
+        self.inc_stat("failed", expired)
+        self.inc_stat("leased", len(rows))
+        self.inc_stat("expired_leases", sum(row[5] == "leased" for row in rows))
+
+        tasks = []
+        for task_id, kind, url, category, ranking_category, _ in rows:
+            self.in_flight.add(task_id)
+            tasks.append(
+                {
+                    "task_id": task_id,
+                    "kind": kind,
+                    "url": url,
+                    "category": category,
+                    "ranking_category": ranking_category,
+                }
+            )
+        return tasks
+
+    def renew(self):
+        """Extend the leases of the tasks this worker is still working on."""
+        if not self.in_flight:
+            return
+        ids = list(self.in_flight)
+        placeholders = ", ".join("?" for _ in ids)
+        self.conn.execute(
+            f"""
+            UPDATE tasks SET lease_expires = ?
+            WHERE state = 'leased' AND owner = ? AND task_id IN ({placeholders})
+            """,
+            (time.time() + self.visibility_timeout, self.owner, *ids),
+        )
+
+    def complete(self, task_id):
+        """Mark a task leased by this worker as done."""
+        self.in_flight.discard(task_id)
+        updated = self.conn.execute(
+            """
+            UPDATE tasks SET state = 'done', owner = NULL
+            WHERE task_id = ? AND owner = ? AND state = 'leased'
+            """,
+            (task_id, self.owner),
+        ).rowcount
+        if updated:
+            self.inc_stat("completed")
+        else:
+            # The lease expired and another worker took the task over. Items
+            # are upserted, so its result simply replaces ours.
+            self.inc_stat("lost_leases")
+
+    def fail(self, task_id, error):
+        """Give a failed task back to the queue, or fail it for good."""
+        self.in_flight.discard(task_id)
+        self.conn.execute(
+            """
+            UPDATE tasks
+            SET state = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END,
+                owner = NULL, error = ?
+            WHERE task_id = ? AND owner = ? AND state = 'leased'
+            """,
+            (self.max_attempts, str(error)[:500], task_id, self.owner),
+        )
+        self.inc_stat("errors")
+
+    def release(self):
+        """Hand the unfinished leases of this worker back to the queue."""
+        ids = list(self.in_flight)
+        self.in_flight.clear()
+        if not ids:
+            return
+        placeholders = ", ".join("?" for _ in ids)
+        released = self.conn.execute(
+            f"""
+            UPDATE tasks SET state = 'pending', owner = NULL,
+                attempts = MAX(attempts - 1, 0)
+            WHERE state = 'leased' AND owner = ? AND task_id IN ({placeholders})
+            """,
+            (self.owner, *ids),
+        ).rowcount
+        self.inc_stat("released", released)
+
+    def drained(self):
+        """Return True once no task is pending or leased by any worker."""
+        row = self.conn.execute(
+            "SELECT 1 FROM tasks WHERE state IN ('pending', 'leased') LIMIT 1"
+        ).fetchone()
+        return row is None
+
+    def counts(self):
+        """Return the number of tasks in each state."""
+        return dict(
+            self.conn.execute("SELECT state, COUNT(*) FROM tasks GROUP BY state")
+        )
+
+    def reset(self):
+        """Drop every task, to start a new crawl."""
+        self.conn.execute("DELETE FROM tasks")
+
+    def item_scraped(self, item, response, spider):
+        # Category pages are completed by the spider once their apps are
+        # queued, and app pages once their item is committed (items_stored).
+        # Without the database writer there is no commit to wait for.
+        task_id = response.meta.get("task_id")
+        writer = getattr(spider.crawler, "db_writer", None)
+        if isinstance(item, AppItem) and task_id is not None and writer is None:
+            self.complete(task_id)
+
+    def items_stored(self, items):
+        for item in items:
+            task_id = package_task_id(item.get("package_id"))
+            if isinstance(item, AppItem) and task_id in self.in_flight:
+                self.complete(task_id)
+
+    def item_store_failed(self, item, error):
+        task_id = package_task_id(item.get("package_id"))
+        if isinstance(item, AppItem) and task_id in self.in_flight:
+            self.fail(task_id, error)
+
+    def spider_error(self, failure, response, spider):
+        task_id = response.meta.get("task_id")
+        if task_id is not None:
+            self.fail(task_id, failure.getErrorMessage())
+
+    def spider_opened(self, spider):
+        # The spider builds the queue before the crawler has its stats
+        if self.stats is None:
+            self.stats = spider.crawler.stats
+        logger.info(f"Worker {self.owner} leasing tasks from {self.path}")
+        self.heartbeat_task = task.LoopingCall(self.renew)
+        self.heartbeat_task.start(self.visibility_timeout / 3, now=False)
+
+    def spider_closed(self, spider, reason):
+        if self.heartbeat_task is not None and self.heartbeat_task.running:
+            self.heartbeat_task.stop()
+        self.release()
+        self.conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("command", choices=["status", "reset"])
+    parser.add_argument("path", help="queue database (WORK_QUEUE_DB)")
+    args = parser.parse_args()
+
+    queue = WorkQueue(args.path)
+    if args.command == "reset":
+        queue.reset()
+    for state, count in sorted(queue.counts().items()):
+        print(f"{state}: {count}")
+    queue.conn.close()
+
+
+if __name__ == "__main__":
+    main()